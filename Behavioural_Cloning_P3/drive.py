@@ -6,27 +6,82 @@ import numpy as np
 import socketio
 import eventlet
 import eventlet.wsgi
+import eventlet.queue
+from eventlet import tpool
 import time
 from PIL import Image
 from PIL import ImageOps
 from flask import Flask, render_template
 from io import BytesIO
 
-from keras.models import model_from_json
-from keras.preprocessing.image import ImageDataGenerator, array_to_img, img_to_array
-from model import cropAndResize, adjustBrightness, normalizeImage
-
-# Fix error with Keras and TensorFlow
-import tensorflow as tf
-tf.python.control_flow_ops = tf
+from inference import SteeringPredictor, loadKerasModel
+from numpy_model import NumpySteeringModel
 
 
 sio = socketio.Server()
 app = Flask(__name__)
 model = None
+predictor = None
 prev_image_array = None
+worker = None
 Kp=0.25
 
+#---------------------------------------------------#
+# Latest frame wins processing - telemetry handler 
+# only keeps the newest frame in a one slot queue &
+# a background green thread predicts it in an OS 
+# thread (tpool), so the server keeps receiving. A 
+# frame not picked up before the next one arrives is
+# dropped instead of queueing stale steering commands
+#---------------------------------------------------#
+class LatestFrameWorker():
+    def __init__(self, predictor, on_result, report_every=100):
+        self.predictor = predictor          # SteeringPredictor used for the frames
+        self.on_result = on_result          # Called with (steering_angle, data, latency) of each frame
+        self.slot = eventlet.queue.LightQueue(maxsize=1)  # Holds only the newest frame
+        self.received = 0                   # Number of frames received
+        self.processed = 0                  # Number of frames predicted
+        self.dropped = 0                    # Number of stale frames dropped
+        self.last_queue_age = 0.0           # Seconds the last processed frame waited in the slot
+        self.max_queue_age = 0.0            # Highest queue age seen
+        self.total_queue_age = 0.0          # Sum of queue ages, for the mean
+        self.report_every = report_every    # Print counters every these many processed frames
+        self.thread = None
+
+    def start(self):
+        self.thread = eventlet.spawn(self.run)
+        return self
+
+    def submit(self, data):
+        self.received += 1
+        if self.slot.full():
+            self.slot.get_nowait()
+            self.dropped += 1
+        self.slot.put_nowait((data, time.perf_counter()))
+
+    def run(self):
+        while True:
+            data, received_at = self.slot.get()
+            queue_age = time.perf_counter() - received_at
+            steering_angle, latency = tpool.execute(self.predictor.predict, data["image"])
+            self.processed += 1
+            self.last_queue_age = queue_age
+            self.max_queue_age = max(self.max_queue_age, queue_age)
+            self.total_queue_age += queue_age
+            self.on_result(steering_angle, data, queue_age+latency)
+            if self.report_every and self.processed % self.report_every == 0:
+                self.printStats()
+
+    def stats(self):
+        return {'received': self.received, 'processed': self.processed, 'dropped': self.dropped,
+                'last_queue_age': self.last_queue_age*1000, 'max_queue_age': self.max_queue_age*1000,
+                'mean_queue_age': self.total_queue_age*1000/max(self.processed, 1)}
+
+    def printStats(self):
+        print('received=%(received)d processed=%(processed)d dropped=%(dropped)d queue age ms '
+              'last=%(last_queue_age).2f mean=%(mean_queue_age).2f max=%(max_queue_age).2f' % self.stats())
+
+
 @sio.on('telemetry')
 def telemetry(sid, data):
     # The current steering angle of the car
@@ -37,21 +92,20 @@ def telemetry(sid, data):
     speed = data["speed"]
     # The current image from the center camera of the car
     imgString = data["image"]
-    image = Image.open(BytesIO(base64.b64decode(imgString)))
-    image_array = np.asarray(image)
-    image_array = cropAndResize(image_array)
-    image_array = adjustBrightness(image_array)
-    image_array = normalizeImage(image_array)
-
-    transformed_image_array = image_array[None, :, :, :]
-    # This model currently assumes that the features of the model are just the images. Feel free to change this.
-    steering_angle = float(model.predict(transformed_image_array, batch_size=1))
+    if worker is not None:
+        worker.submit(data)
+        return
+    steering_angle, latency = predictor.predict(imgString)
+    steer(steering_angle, data, latency)
+
+
+def steer(steering_angle, data, latency):
     # The driving model currently just outputs a constant throttle. Feel free to edit this.
     #throttle = 0.2
-    throttle = min(max(Kp*(16.0-float(speed)), 0.0), 1.0)
+    throttle = min(max(Kp*(16.0-float(data["speed"])), 0.0), 1.0)
 
-    print(steering_angle, throttle)
-    send_control(steering_angle, throttle)
+    print(steering_angle, throttle, '%.2fms' % (latency*1000))
+    send_control(steering_angle, throttle, data.get("frame_id"))
 
 
 @sio.on('connect')
@@ -60,31 +114,33 @@ def connect(sid, environ):
     send_control(0, 0)
 
 
-def send_control(steering_angle, throttle):
-    sio.emit("steer", data={
+def send_control(steering_angle, throttle, frame_id=None):
+    data = {
     'steering_angle': steering_angle.__str__(),
     'throttle': throttle.__str__()
-    }, skip_sid=True)
+    }
+    # Echo the frame id sent by the replay client, the simulator does not send one
+    if frame_id is not None:
+        data['frame_id'] = frame_id
+    sio.emit("steer", data=data, skip_sid=True)
 
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Remote Driving')
     parser.add_argument('model', type=str,
-    help='Path to model definition json. Model weights should be on the same path.')
+    help='Path to model definition json (weights should be on the same path) or an exported .npz model.')
+    parser.add_argument('--latest-frame', action='store_true',
+    help='Predict in a background worker that always takes the newest frame and drops stale ones.')
     args = parser.parse_args()
-    with open(args.model, 'r') as jfile:
-        # NOTE: if you saved the file by calling json.dump(model.to_json(), ...)
-        # then you will have to call:
-        #
-        #   model = model_from_json(json.loads(jfile.read()))\
-        #
-        # instead.
-        model = model_from_json(jfile.read())
-
-
-    model.compile("adam", "mse")
-    weights_file = args.model.replace('json', 'h5')
-    model.load_weights(weights_file)
+    if args.model.endswith('.npz'):
+        # Exported int8 model (export_model.py), runs on numpy with out Keras/TensorFlow
+        model = NumpySteeringModel(args.model)
+        predictor = SteeringPredictor(model, model.predict)
+    else:
+        model = loadKerasModel(args.model)
+        predictor = SteeringPredictor(model)
+    if args.latest_frame:
+        worker = LatestFrameWorker(predictor, steer).start()
 
     # wrap Flask application with engineio's middleware
     app = socketio.Middleware(sio, app)
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from predict_log import imageBatches
+from inference import compilePredictFunction, loadKerasModel
+from numpy_model import NumpySteeringModel, quantizeWeights
+
+#---------------------------------------------------#
+# Define Export Parameters
+#---------------------------------------------------#
+MODEL_FILE_NAME = 'model.json'
+CSV_FILE_NAME = 'driving_log.csv'
+EXPORT_FILE_NAME = 'model_int8.npz'
+VALIDATION_FRAMES = 512
+LATENCY_REPEATS = 200
+
+#---------------------------------------------------#
+# Describe a Keras (1.x, tf dim ordering) layer as a
+# plain dict spec for the numpy runner.  Dropout is
+# an identity at inference, so it is folded away
+#---------------------------------------------------#
+def layerSpec(layer):
+    kind = layer.__class__.__name__
+    config = layer.get_config()
+    if kind == 'Convolution2D':
+        if config.get('dim_ordering', 'tf') != 'tf':
+            raise ValueError('Only tf dim ordering is supported, got %s' % config['dim_ordering'])
+        return {'type': 'conv', 'stride': list(config['subsample']), 'border_mode': config['border_mode'],
+                'activation': config['activation']}
+    if kind == 'Dense':
+        return {'type': 'dense', 'activation': config['activation']}
+    if kind in ('MaxPooling2D', 'AveragePooling2D'):
+        return {'type': 'maxpool' if kind == 'MaxPooling2D' else 'avgpool',
+                'pool_size': list(config['pool_size']),
+                'stride': list(config['strides'] or config['pool_size']),
+                'border_mode': config['border_mode']}
+    if kind == 'ELU':
+        return {'type': 'elu', 'alpha': float(config['alpha'])}
+    if kind == 'Activation':
+        return {'type': 'activation', 'activation': config['activation']}
+    if kind == 'Flatten':
+        return {'type': 'flatten'}
+    if kind == 'Dropout':
+        return None
+    raise ValueError('Layer %s can not be exported' % kind)
+
+#---------------------------------------------------#
+# Freeze the trained model into layer specs plus int8
+# weights, per channel scales & float32 biases
+#---------------------------------------------------#
+def exportArrays(model):
+    layers, arrays = [], {}
+    for layer in model.layers:
+        spec = layerSpec(layer)
+        if spec is None:
+            continue
+        if spec['type'] in ('conv', 'dense'):
+            w, b = layer.get_weights()
+            i = len(layers)
+            arrays['w%d' % i], arrays['s%d' % i] = quantizeWeights(w)
+            arrays['b%d' % i] = b.astype(np.float32)
+        layers.append(spec)
+    return layers, arrays
+
+#---------------------------------------------------#
+# Validation pass - steering error of the exported
+# runner (int8 rounded weights) against the float
+# Keras model over driving log frames
+#---------------------------------------------------#
+def validateExport(runner, predict_function, file_names):
+    errors = []
+    for batch in imageBatches(file_names, batch_size=128):
+        errors.append(runner.predict(batch)[:, 0] - predict_function(batch)[:, 0])
+    errors = np.concatenate(errors)
+    return {'frames': len(errors), 'mae': float(np.abs(errors).mean()),
+            'max_error': float(np.abs(errors).max())}
+
+#---------------------------------------------------#
+# Per frame latency (batch of one, as drive.py runs)
+# of the numpy runner & the Keras predict function
+#---------------------------------------------------#
+def frameLatency(predict, frame, repeats=LATENCY_REPEATS):
+    predict(frame)
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        predict(frame)
+        times.append(time.perf_counter() - start)
+    return {'median_ms': 1000*float(np.median(times)), 'p90_ms': 1000*float(np.percentile(times, 90))}
+
+def compareLatency(runner, predict_function, frame, repeats=LATENCY_REPEATS):
+    return {'numpy': frameLatency(runner.predict, frame, repeats),
+            'keras': frameLatency(predict_function, frame, repeats)}
+
+def saveExport(export_file, layers, arrays, metadata):
+    np.savez_compressed(export_file, layers=json.dumps(layers), metadata=json.dumps(metadata), **arrays)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the steering model as an int8 numpy artifact')
+    parser.add_argument('--model', type=str, default=MODEL_FILE_NAME,
+    help='Path to model definition json. Model weights should be on the same path.')
+    parser.add_argument('--log', type=str, default=CSV_FILE_NAME,
+    help='Driving log csv used for the validation pass.')
+    parser.add_argument('--frames', type=int, default=VALIDATION_FRAMES, help='Validation frames.')
+    parser.add_argument('--output', type=str, default=EXPORT_FILE_NAME)
+    args = parser.parse_args()
+
+    model = loadKerasModel(args.model)
+    layers, arrays = exportArrays(model)
+    metadata = {'source': os.path.basename(args.model),
+                'quantization': 'int8 per channel weights, dequantized to float32 at load'}
+    saveExport(args.output, layers, arrays, metadata)
+
+    df = pd.read_csv(args.log, header=0, usecols=[0], names=['CenterImg'])
+    df = df.sample(n=min(args.frames, df.shape[0]), random_state=0)
+    img_dir = os.path.dirname(os.path.abspath(args.log))
+    file_names = [os.path.join(img_dir, name.strip()) for name in df['CenterImg']]
+    runner = NumpySteeringModel(args.output)
+    predict_function = compilePredictFunction(model)
+    metadata['validation'] = validateExport(runner, predict_function, file_names)
+    frame = next(imageBatches(file_names[:1], batch_size=1)).copy()
+    metadata['latency'] = compareLatency(runner, predict_function, frame)
+    saveExport(args.output, layers, arrays, metadata)
+
+    print('Validation over %(frames)d frames: steering MAE=%(mae).5f max error=%(max_error).5f'
+          % metadata['validation'])
+    for name, latency in sorted(metadata['latency'].items()):
+        print('%-5s per frame latency: median %.2fms p90 %.2fms' % (name, latency['median_ms'], latency['p90_ms']))
+    print('Exported', args.output, '(%d bytes)' % os.path.getsize(args.output))
@@ -0,0 +1,117 @@
+import base64
+import time
+import numpy as np
+import cv2
+from io import BytesIO
+from PIL import Image
+
+#---------------------------------------------------#
+# Define Inference Parameters - the crop rows & image
+# size are the same as cropAndResize in model.py
+#---------------------------------------------------#
+CROP_TOP, CROP_BOTTOM = 55, 135
+ROWS, COLS, DEPTH = 64, 64, 3
+LATENCY_WINDOW = 1000
+REPORT_EVERY = 100
+
+#---------------------------------------------------#
+# Build a backend function that runs the forward pass
+# of the model in test mode (dropout disabled), with
+# out the batching & callbacks of model.predict
+#---------------------------------------------------#
+def compilePredictFunction(model):
+    from keras import backend as K
+    if model.uses_learning_phase:
+        function = K.function(model.inputs + [K.learning_phase()], model.outputs)
+        return lambda batch: function([batch, 0])[0]
+    function = K.function(model.inputs, model.outputs)
+    return lambda batch: function([batch])[0]
+
+#---------------------------------------------------#
+# Load the model definition json & the weights saved
+# alongside it with h5 extension.  Keras & TensorFlow
+# are imported here only, so the numpy model paths do
+# not need them
+#---------------------------------------------------#
+def loadKerasModel(model_file):
+    from keras.models import model_from_json
+
+    # Fix error with Keras and TensorFlow
+    import tensorflow as tf
+    tf.python.control_flow_ops = tf
+
+    with open(model_file, 'r') as jfile:
+        model = model_from_json(jfile.read())
+    model.compile("adam", "mse")
+    model.load_weights(model_file.replace('json', 'h5'))
+    return model
+
+#---------------------------------------------------#
+# Decode the base64 encoded image sent by simulator
+#---------------------------------------------------#
+def decodeImage(img_string):
+    return np.asarray(Image.open(BytesIO(base64.b64decode(img_string))))
+
+#---------------------------------------------------#
+# Deterministic preprocessing for inference - crop,
+# resize & normalize into the float32 buffer given.
+# No brightness augmentation is done at inference
+#---------------------------------------------------#
+def preprocessImage(image, resized, normalized):
+    cv2.resize(image[CROP_TOP:CROP_BOTTOM], (COLS, ROWS), dst=resized)
+    np.multiply(resized, np.float32(1/255.0), out=normalized)
+    normalized -= np.float32(0.5)
+    return normalized
+
+#---------------------------------------------------#
+# Inference engine for the telemetry handler.  It
+# reuses the same resize & float32 batch buffers for
+# every frame, calls the compiled predict function
+# directly and keeps the latency of recent frames
+#---------------------------------------------------#
+class SteeringPredictor():
+    def __init__(self, model, predict_function=None, report_every=REPORT_EVERY):
+        self.predict_function = predict_function or compilePredictFunction(model)
+        self.resized = np.empty((ROWS, COLS, DEPTH), dtype=np.uint8)      # Cropped & resized frame
+        self.batch = np.empty((1, ROWS, COLS, DEPTH), dtype=np.float32)   # Normalized batch of one frame
+        self.latencies = np.zeros((LATENCY_WINDOW, 3))  # Decode, preprocess & predict seconds of recent frames
+        self.count = 0                                  # Number of frames predicted
+        self.report_every = report_every                # Print latency report every these many frames
+
+    def predictImage(self, image):
+        start = time.perf_counter()
+        preprocessImage(image, self.resized, self.batch[0])
+        preprocessed = time.perf_counter()
+        steering_angle = float(self.predict_function(self.batch)[0, 0])
+        predicted = time.perf_counter()
+        return steering_angle, preprocessed-start, predicted-preprocessed
+
+    def predict(self, img_string):
+        start = time.perf_counter()
+        image = decodeImage(img_string)
+        decode_time = time.perf_counter() - start
+        steering_angle, preprocess_time, predict_time = self.predictImage(image)
+        self.latencies[self.count % LATENCY_WINDOW] = (decode_time, preprocess_time, predict_time)
+        self.count += 1
+        if self.report_every and self.count % self.report_every == 0:
+            self.printLatencyReport()
+        return steering_angle, decode_time+preprocess_time+predict_time
+
+    #---------------------------------------------------#
+    # Latency percentiles (in ms) of the recent frames
+    #---------------------------------------------------#
+    def latencyReport(self):
+        recent = self.latencies[:min(self.count, LATENCY_WINDOW)] * 1000.0
+        total = recent.sum(axis=1)
+        return {'frames': self.count,
+                'p50': np.percentile(total, 50), 'p90': np.percentile(total, 90),
+                'p99': np.percentile(total, 99), 'max': total.max(),
+                'decode': recent[:, 0].mean(), 'preprocess': recent[:, 1].mean(),
+                'predict': recent[:, 2].mean()}
+
+    def printLatencyReport(self):
+        if self.count == 0:
+            return
+        report = self.latencyReport()
+        print('frames=%(frames)d latency ms p50=%(p50).2f p90=%(p90).2f p99=%(p99).2f max=%(max).2f '
+              '(decode=%(decode).2f preprocess=%(preprocess).2f predict=%(predict).2f)' % report)
@@ -1,4 +1,12 @@
 import random
+import os
+import json
+import time
+import pickle
+import glob
+import hashlib
+import argparse
+import threading
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -10,6 +18,8 @@ from keras.layers.convolutional import Convolution2D
 from keras.layers.advanced_activations import ELU
 from keras.layers.pooling import AveragePooling2D, MaxPooling2D
 from keras.optimizers import Adam
+from keras.callbacks import Callback
+from sampler import SteeringSampler
 
 #---------------------------------------------------#
 # Define Processing Parameters
@@ -25,6 +35,20 @@ INPUT_SHAPE = (ROWS, COLS, DEPTH)
 TRAINING_SPLIT = 0.8
 WEIGHTS_FILE_NAME = 'model.h5'
 MODEL_FILE_NAME = 'model.json'
+CAMERA_COLUMNS = ['CenterImg', 'LeftImg', 'RightImg']
+STEER_CORRECTION = [0.0, 0.25, -0.25]
+CACHE_IMAGES_FILE_NAME = 'driving_log_images.npy'
+CACHE_STEERS_FILE_NAME = 'driving_log_steers.npy'
+CACHE_SOURCE_FILE_NAME = 'driving_log_cache.json'	# Fingerprint of the driving log the cache was built from
+STEER_BIN_WEIGHTS = None	# None weights the steering bins by bin_size**0.5 (see sampler.py)
+SAMPLER_SEED = None
+AUGMENT_SEED = None
+VALIDATION_SEED = 0
+NB_VAL_SAMPLES = 1000
+CHECKPOINT_EVERY = 1	# Save a checkpoint every these many epochs
+CHECKPOINT_WEIGHTS_FILE_NAME = 'checkpoint_epoch%d.h5'	# One weights file per epoch, %d is the epoch
+CHECKPOINT_STATE_FILE_NAME = 'checkpoint.p'
+TRAINING_LOG_FILE_NAME = 'training_log.jsonl'
 
 #---------------------------------------------------#
 # Flip Image Horizontally
@@ -61,27 +85,10 @@ def normalizeImage(image):
     return image1
 
 #---------------------------------------------------#
-# High Level Function to read image from the given
-# dataframe record & perform the image preprocessings
+# Random augmentation applied to a cropped & resized
+# image on every batch - flip, brightness & normalize
 #---------------------------------------------------#
-def readImageWithLabel(df_row):
-	#---------------------------------------------------#
-	# Randomly pick Center/Left/Right image
-	#---------------------------------------------------#
-	options = ['CenterImg', 'LeftImg', 'RightImg']
-	imgToRead = random.choice(options)
-	steer = df_row['SteerAngle']
-	if imgToRead == 'LeftImg':
-		steer += 0.25
-	elif imgToRead == 'RightImg':
-		steer -= 0.25
-
-	#---------------------------------------------------#
-	# Read the image, crop the sky & bonnet & resize it
-	#---------------------------------------------------#
-	image = ndimage.imread(df_row[imgToRead].strip())
-	image = cropAndResize(image, IMG_SIZE)
-
+def augmentImage(image, steer):
 	#---------------------------------------------------#
 	# Flip 50% of image
 	#---------------------------------------------------#
@@ -102,6 +109,125 @@ def readImageWithLabel(df_row):
 
 	return image, steer
 
+#---------------------------------------------------#
+# Largest brightness gain each V (max of R,G,B) value 
+# can take before saturating at 255 - a lookup table
+# used by the batch brightness adjustment
+#---------------------------------------------------#
+MAX_GAIN_LUT = (255.0 / np.maximum(np.arange(256), 1)).astype(np.float32)
+
+#---------------------------------------------------#
+# Vectorized version of augmentImage for a uint8 batch
+# of shape (B, 64, 64, 3) - flips a random half, scales
+# the brightness of 80% of images & normalizes the
+# whole batch in float32
+#---------------------------------------------------#
+def augmentBatch(images, steers, rng=np.random):
+	batch_size, rows, cols, depth = images.shape
+	images = np.array(images, dtype=np.uint8)
+	steers = np.array(steers, dtype=np.float32)
+
+	#---------------------------------------------------#
+	# Flip 50% of images, one cv2.flip on the stacked 
+	# subset instead of one call per image
+	#---------------------------------------------------#
+	flip = np.nonzero(rng.random_sample(batch_size) > 0.5)[0]
+	if len(flip) > 0:
+		images[flip] = cv2.flip(images[flip].reshape(-1, cols, depth), 1).reshape(-1, rows, cols, depth)
+		steers[flip] = -1*steers[flip]
+
+	#---------------------------------------------------#
+	# Adjust brightness of 80% of images. Scaling V of HSV
+	# keeps hue & saturation, which is the same as scaling
+	# R,G,B by the factor, so it is a single multiply for
+	# the batch. Only the images brightened beyond 1.0 
+	# need a per pixel gain to saturate V at 255
+	#---------------------------------------------------#
+	factors = np.where(rng.random_sample(batch_size) > 0.2,
+		.25+rng.uniform(size=batch_size), 1.0).astype(np.float32)
+	out = np.multiply(images, (factors/255.0)[:, None, None, None], dtype=np.float32)
+	bright = np.nonzero(factors > 1.0)[0]
+	if len(bright) > 0:
+		subset = images[bright]
+		value = np.maximum(np.maximum(subset[..., 0], subset[..., 1]), subset[..., 2])
+		gain = np.minimum(MAX_GAIN_LUT[value], factors[bright, None, None]) / 255.0
+		out[bright] = subset * gain[..., None]
+
+	#---------------------------------------------------#
+	# Normalize the intensity of images
+	#---------------------------------------------------#
+	out -= 0.5
+
+	return out, steers
+
+#---------------------------------------------------#
+# High Level Function to read image from the given
+# dataframe record & perform the image preprocessings
+#---------------------------------------------------#
+def readImageWithLabel(df_row):
+	#---------------------------------------------------#
+	# Randomly pick Center/Left/Right image
+	#---------------------------------------------------#
+	camera = random.randrange(len(CAMERA_COLUMNS))
+	steer = df_row['SteerAngle'] + STEER_CORRECTION[camera]
+
+	#---------------------------------------------------#
+	# Read the image, crop the sky & bonnet & resize it
+	#---------------------------------------------------#
+	image = ndimage.imread(df_row[CAMERA_COLUMNS[camera]].strip())
+	image = cropAndResize(image, IMG_SIZE)
+
+	return augmentImage(image, steer)
+
+#---------------------------------------------------#
+# One time preprocessing - decode, crop & resize the
+# center/left/right images of every record into a 
+# memory mapped uint8 array of shape (N, 3, 64, 64, 3)
+# and save the steering angles alongside
+#---------------------------------------------------#
+def buildImageCache(df, images_file=CACHE_IMAGES_FILE_NAME, steers_file=CACHE_STEERS_FILE_NAME):
+	images = np.lib.format.open_memmap(images_file, mode='w+', dtype=np.uint8,
+		shape=(df.shape[0], len(CAMERA_COLUMNS), ROWS, COLS, DEPTH))
+	for i, (index, row) in enumerate(df.iterrows()):
+		for camera, column in enumerate(CAMERA_COLUMNS):
+			image = ndimage.imread(row[column].strip())
+			images[i, camera] = cropAndResize(image, IMG_SIZE)
+	images.flush()
+	steers = df['SteerAngle'].values.astype(np.float32)
+	np.save(steers_file, steers)
+	return images, steers
+
+#---------------------------------------------------#
+# Open the cached images (read only memory map) and
+# steering angles, build the cache if it is missing,
+# does not match the given dataframe or was built
+# from another driving log (see logFingerprint).  The
+# log's fingerprint is written once the cache is
+# built, so an interrupted build is built again
+#---------------------------------------------------#
+def loadImageCache(df, log_fingerprint, images_file=CACHE_IMAGES_FILE_NAME, 
+		steers_file=CACHE_STEERS_FILE_NAME, source_file=CACHE_SOURCE_FILE_NAME):
+	expected_shape = (df.shape[0], len(CAMERA_COLUMNS), ROWS, COLS, DEPTH)
+	try:
+		with open(source_file) as f:
+			source = json.load(f)
+		images = np.load(images_file, mmap_mode='r')
+		steers = np.load(steers_file)
+	except (IOError, ValueError):
+		source, images, steers = None, None, None
+	if (source != log_fingerprint or images is None or images.shape != expected_shape 
+			or steers.shape != expected_shape[:1]):
+		print('Building image cache', images_file)
+		if os.path.exists(source_file):
+			os.remove(source_file)
+		images = steers = None	# release the stale memory map before it is rewritten
+		buildImageCache(df, images_file, steers_file)
+		with open(source_file, 'w') as f:
+			json.dump(log_fingerprint, f)
+		images = np.load(images_file, mmap_mode='r')
+		steers = np.load(steers_file)
+	return images, steers
+
 #---------------------------------------------------#
 # Generator to feed images of required batch size 
 # to model for training/validation
@@ -127,6 +253,206 @@ def imageDataGenerator(df, batch_size=32):
 			batch_counter = 0
 		yield X_batch, y_batch
 
+#---------------------------------------------------#
+# Generator to feed images of required batch size 
+# from the image cache, only the random camera pick
+# and the batch augmentation are done per batch.
+# With a sampler, the batch indices are drawn from it
+# instead of walking the indices sequentially.
+#
+# Its position & random state can be saved and set
+# to resume training exactly.  Keras reads batches
+# ahead in a queue, so the state before every batch
+# produced is kept until the batch is consumed
+#---------------------------------------------------#
+class BatchGenerator():
+	def __init__(self, images, steers, indices, batch_size=32, sampler=None, seed=None):
+		self.images = images							# Image cache (N, 3, 64, 64, 3)
+		self.steers = steers							# Steering angles of the image cache
+		self.indices = indices							# Records of the cache used by this generator
+		self.batch_size = batch_size
+		self.sampler = sampler							# SteeringSampler drawing the batches, if any
+		self.batches_per_epoch = len(indices) // batch_size
+		self.rng = np.random.RandomState(seed)			# Random state for camera pick & augmentation
+		self.batch_counter = 0							# Position of next batch when not sampling
+		self.produced = 0								# Number of batches produced
+		self.produce_seconds = 0.0						# Time spent producing batches (data loading)
+		self.snapshots = {}								# State before each batch not yet consumed
+		self.lock = threading.Lock()					# Guards snapshots, Keras reads in another thread
+		self.initial_state = self.getState()
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		start = time.perf_counter()
+		with self.lock:
+			self.snapshots[self.produced] = self.getState()
+		if self.sampler is not None:
+			batch_idx = self.indices[self.sampler.draw(self.batch_size)]
+		else:
+			batch_idx = self.indices[self.batch_counter*self.batch_size:(self.batch_counter+1)*self.batch_size]
+			self.batch_counter += 1
+			if self.batch_counter == self.batches_per_epoch:
+				# Reset Batch Counter
+				self.batch_counter = 0
+		cameras = self.rng.randint(len(CAMERA_COLUMNS), size=self.batch_size)
+
+		#---------------------------------------------------#
+		# Fancy indexing copies the batch out of the memmap
+		#---------------------------------------------------#
+		raw_batch = self.images[batch_idx, cameras]
+		steer_batch = self.steers[batch_idx] + np.asarray(STEER_CORRECTION, dtype=np.float32)[cameras]
+		X_batch, y_batch = augmentBatch(raw_batch, steer_batch, self.rng)
+
+		self.produced += 1
+		self.produce_seconds += time.perf_counter() - start
+		return X_batch, y_batch
+
+	next = __next__
+
+	def getState(self):
+		return {'rng': self.rng.get_state(), 'batch_counter': self.batch_counter, 'produced': self.produced,
+			'sampler': self.sampler.getState() if self.sampler is not None else None}
+
+	def setState(self, state):
+		self.rng.set_state(state['rng'])
+		self.batch_counter = state['batch_counter']
+		self.produced = state['produced']
+		if self.sampler is not None:
+			self.sampler.setState(state['sampler'])
+		with self.lock:
+			self.snapshots = {}
+
+	#---------------------------------------------------#
+	# State to resume from once the given number of 
+	# batches are consumed, older snapshots are dropped
+	#---------------------------------------------------#
+	def stateAfterConsumed(self, consumed):
+		with self.lock:
+			for produced in [key for key in self.snapshots if key < consumed]:
+				del self.snapshots[produced]
+			if consumed in self.snapshots:
+				return self.snapshots[consumed]
+			# Batch not started yet, current state is the one after consumed batches
+			return self.getState()
+
+	def reset(self):
+		self.setState(self.initial_state)
+
+#---------------------------------------------------#
+# Keras callback logging the throughput, data loading
+# vs compute time & validation loss of every epoch to
+# a json lines file, and saving a checkpoint with the
+# weights, optimizer state & generator positions.
+# Validation generator restarts from the same state
+# every epoch, so the validation loss is comparable
+#---------------------------------------------------#
+class TrainingMonitor(Callback):
+	def __init__(self, trainGen, validGen, split_idx, log_fingerprint, initial_epoch=0, 
+			log_file=TRAINING_LOG_FILE_NAME, checkpoint_every=CHECKPOINT_EVERY):
+		super(TrainingMonitor, self).__init__()
+		self.trainGen = trainGen
+		self.validGen = validGen
+		self.split_idx = split_idx						# Shuffled records, training then validation
+		self.log_fingerprint = log_fingerprint			# Driving log the split was made for
+		self.initial_epoch = initial_epoch				# Epochs done before this run, Keras counts from 0
+		self.log_file = log_file
+		self.checkpoint_every = checkpoint_every
+		self.consumed = trainGen.produced				# Training batches consumed by the model
+		self.resume_state = trainGen.getState()			# Generator state after the consumed batches
+
+	def on_epoch_begin(self, epoch, logs=None):
+		self.validGen.reset()
+		self.epoch_start = time.perf_counter()
+		self.produce_start = self.trainGen.produce_seconds
+		self.compute_seconds = 0.0
+		self.epoch_batches = 0
+
+	def on_batch_begin(self, batch, logs=None):
+		self.batch_start = time.perf_counter()
+
+	def on_batch_end(self, batch, logs=None):
+		self.compute_seconds += time.perf_counter() - self.batch_start
+		self.epoch_batches += 1
+		self.consumed += 1
+		self.resume_state = self.trainGen.stateAfterConsumed(self.consumed)
+
+	def on_epoch_end(self, epoch, logs=None):
+		logs = logs or {}
+		seconds = time.perf_counter() - self.epoch_start
+		epoch += self.initial_epoch
+		record = {'epoch': epoch+1, 'seconds': seconds,
+			'samples_per_second': self.epoch_batches*self.trainGen.batch_size/seconds,
+			'data_seconds': self.trainGen.produce_seconds - self.produce_start,
+			'compute_seconds': self.compute_seconds,
+			'loss': float(logs.get('loss', float('nan'))), 'val_loss': float(logs.get('val_loss', float('nan')))}
+		with open(self.log_file, 'a') as f:
+			f.write(json.dumps(record) + '\n')
+		print('Epoch %(epoch)d: %(samples_per_second).1f samples/s, data %(data_seconds).1fs, '
+			'compute %(compute_seconds).1fs, val_loss %(val_loss).5f' % record)
+		if self.checkpoint_every and (epoch+1) % self.checkpoint_every == 0:
+			saveCheckpoint(self.model, epoch+1, self.resume_state, self.split_idx, self.log_fingerprint)
+
+#---------------------------------------------------#
+# Save & load the checkpoint - weights in an h5 file
+# per epoch and the rest of the training state in a
+# pickle file. Files are written to a temporary name
+# & then renamed, so an interruption never leaves a
+# half written file. The state file is renamed last &
+# names its weights file, so an interruption between
+# the two always leaves a matching pair; the weights
+# of older epochs are removed after it.
+# The driving log's record count & md5 are kept with
+# the split, a changed log can not be resumed
+#---------------------------------------------------#
+def logFingerprint(csv_file, records):
+	md5 = hashlib.md5()
+	with open(csv_file, 'rb') as f:
+		for chunk in iter(lambda: f.read(1 << 20), b''):
+			md5.update(chunk)
+	return {'records': records, 'md5': md5.hexdigest()}
+
+def saveCheckpoint(model, epoch, train_gen_state, split_idx, log_fingerprint,
+		weights_file=CHECKPOINT_WEIGHTS_FILE_NAME, state_file=CHECKPOINT_STATE_FILE_NAME):
+	epoch_weights_file = weights_file % epoch
+	model.save_weights(epoch_weights_file + '.tmp', overwrite=True)
+	os.replace(epoch_weights_file + '.tmp', epoch_weights_file)
+	state = {'epoch': epoch, 'weights_file': epoch_weights_file, 'optimizer': model.optimizer.get_weights(), 
+		'train_gen': train_gen_state, 'split_idx': split_idx, 'log': log_fingerprint}
+	with open(state_file + '.tmp', 'wb') as f:
+		pickle.dump(state, f)
+	os.replace(state_file + '.tmp', state_file)
+	for file_name in glob.glob(weights_file.replace('%d', '*')):
+		if file_name != epoch_weights_file:
+			os.remove(file_name)
+	print('Saved checkpoint of epoch', epoch, 'to', epoch_weights_file)
+
+def loadCheckpoint(model, log_fingerprint, weights_file=CHECKPOINT_WEIGHTS_FILE_NAME, 
+		state_file=CHECKPOINT_STATE_FILE_NAME):
+	with open(state_file, 'rb') as f:
+		state = pickle.load(f)
+	if state.get('log') != log_fingerprint:
+		raise ValueError('Checkpoint %s was saved for a different driving log (%s), not %s' 
+			% (state_file, state.get('log'), log_fingerprint))
+	if state.get('weights_file') != weights_file % state['epoch'] or not os.path.exists(state['weights_file']):
+		raise ValueError('Checkpoint %s of epoch %d has no weights file %s' 
+			% (state_file, state['epoch'], weights_file % state['epoch']))
+	model.load_weights(state['weights_file'])
+	#---------------------------------------------------#
+	# Optimizer weights are created with the training
+	# function, build it before setting them
+	#---------------------------------------------------#
+	model._make_train_function()
+	model.optimizer.set_weights(state['optimizer'])
+	return state
+
+def removeCheckpoint(weights_file=CHECKPOINT_WEIGHTS_FILE_NAME, state_file=CHECKPOINT_STATE_FILE_NAME):
+	if os.path.exists(state_file):
+		os.remove(state_file)
+	for file_name in glob.glob(weights_file.replace('%d', '*')):
+		os.remove(file_name)
+
 #---------------------------------------------------#
 # Define the Neural Network Model
 #---------------------------------------------------#
@@ -176,6 +502,10 @@ def getModel():
 
 
 if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Train the steering model')
+	parser.add_argument('--resume', action='store_true',
+	help='Continue the interrupted run saved in %s.' % CHECKPOINT_STATE_FILE_NAME)
+	args = parser.parse_args()
 	
 	#---------------------------------------------------#
 	# Create DataFrame & Split for Training & Validation
@@ -183,23 +513,49 @@ if __name__ == "__main__":
 	df_a = pd.read_csv(CSV_FILE_NAME, header=0, usecols=[0, 1, 2, 3], names=['CenterImg', 'LeftImg', 'RightImg', 'SteerAngle'])
 	print('df_a record count', df_a.shape[0])
 	train_rows_count = int(df_a.shape[0]*TRAINING_SPLIT)
-	df_a = df_a.sample(frac=1).reset_index(drop=True)
-	df_t = df_a.loc[0:train_rows_count-1]
-	df_v = df_a.loc[train_rows_count:]
-	df_v = df_v.reset_index(drop=True)
-	print('df_t record count', df_t.shape[0])
-	print('df_v record count', df_v.shape[0])
+	log_fingerprint = logFingerprint(CSV_FILE_NAME, df_a.shape[0])
+
+	#---------------------------------------------------#
+	# Decode, crop & resize all the images only once
+	#---------------------------------------------------#
+	images, steers = loadImageCache(df_a, log_fingerprint)
+	model = getModel()
+	state = None
+	if args.resume:
+		print('Resuming from checkpoint', CHECKPOINT_STATE_FILE_NAME)
+		state = loadCheckpoint(model, log_fingerprint)
+		shuffled_idx = state['split_idx']
+	else:
+		if os.path.exists(CHECKPOINT_STATE_FILE_NAME):
+			print('Starting a new run, checkpoint', CHECKPOINT_STATE_FILE_NAME, 'is not resumed (use --resume)')
+		shuffled_idx = np.random.permutation(df_a.shape[0])
+	train_idx = shuffled_idx[:train_rows_count]
+	valid_idx = shuffled_idx[train_rows_count:]
+	print('df_t record count', len(train_idx))
+	print('df_v record count', len(valid_idx))
 	df_a = None
 
 	#---------------------------------------------------#
 	# Create Model & Train the model using generators
 	#---------------------------------------------------#
-	model = getModel()
-	trainGen = imageDataGenerator(df_t, BATCH_SIZE)
-	validGen = imageDataGenerator(df_v, BATCH_SIZE)
+	trainSampler = SteeringSampler(steers[train_idx], STEER_BIN_WEIGHTS, 
+		samples_per_epoch=SAMPLES_PER_EPOCH, seed=SAMPLER_SEED)
+	trainSampler.printDistribution()
+	trainGen = BatchGenerator(images, steers, train_idx, BATCH_SIZE, trainSampler, AUGMENT_SEED)
+	validGen = BatchGenerator(images, steers, valid_idx, BATCH_SIZE, seed=VALIDATION_SEED)
+	initial_epoch = 0
+	if state is not None:
+		trainGen.setState(state['train_gen'])
+		initial_epoch = state['epoch']
+	monitor = TrainingMonitor(trainGen, validGen, shuffled_idx, log_fingerprint, initial_epoch)
 	print('Training the model')
-	model.fit_generator(trainGen, samples_per_epoch = SAMPLES_PER_EPOCH, nb_epoch = EPOCH_COUNT, 
-		validation_data = validGen, nb_val_samples = 1000)
+	#---------------------------------------------------#
+	# Keras 1.0.7 fit_generator has no initial_epoch, it
+	# runs the remaining epochs & the monitor offsets the
+	# epoch numbers it logs & checkpoints by the done ones
+	#---------------------------------------------------#
+	model.fit_generator(trainGen, samples_per_epoch = SAMPLES_PER_EPOCH, nb_epoch = EPOCH_COUNT - initial_epoch, 
+		validation_data = validGen, nb_val_samples = NB_VAL_SAMPLES, callbacks = [monitor])
 	print('Model trained successfully')
 	
 	#---------------------------------------------------#
@@ -211,5 +567,8 @@ if __name__ == "__main__":
 	print('Saving model to', MODEL_FILE_NAME)
 	with open(MODEL_FILE_NAME, 'w') as f:
 	   f.write(model.to_json())
+
+	# The run is complete, its checkpoint must not be resumed again
+	removeCheckpoint()
 	print('#---------------------------------------------------#')
 	
\ No newline at end of file
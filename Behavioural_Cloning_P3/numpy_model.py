@@ -0,0 +1,120 @@
+import json
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+#---------------------------------------------------#
+# Lightweight numpy runner for the steering model
+# exported by export_model.py - no Keras/TensorFlow
+# needed to load or run it.  Weights are stored as
+# int8 with a float32 scale per output channel, which
+# only makes the artifact ~4x smaller: they are
+# dequantized once when the model is loaded and the
+# forward pass is float32, the same math as Keras.
+# Integer matmuls in numpy do not use BLAS, so int8
+# math would be slower here, not faster
+#---------------------------------------------------#
+
+#---------------------------------------------------#
+# Padding (before, after) of Keras 'same' border mode
+#---------------------------------------------------#
+def samePadding(size, kernel, stride):
+    out = (size + stride - 1) // stride
+    total = max((out - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+#---------------------------------------------------#
+# Sliding windows of shape (B, H', W', C, kh, kw) as a
+# strided view of the (padded) input, no copy
+#---------------------------------------------------#
+def windows(x, kernel, stride, border_mode, pad_value=0.0):
+    if border_mode == 'same':
+        pad_rows = samePadding(x.shape[1], kernel[0], stride[0])
+        pad_cols = samePadding(x.shape[2], kernel[1], stride[1])
+        x = np.pad(x, ((0, 0), pad_rows, pad_cols, (0, 0)), 'constant', constant_values=pad_value)
+    batch, rows, cols, depth = x.shape
+    out_rows = (rows - kernel[0]) // stride[0] + 1
+    out_cols = (cols - kernel[1]) // stride[1] + 1
+    sb, sr, sc, sd = x.strides
+    return as_strided(x, shape=(batch, out_rows, out_cols, depth, kernel[0], kernel[1]),
+                      strides=(sb, sr*stride[0], sc*stride[1], sd, sr, sc), writeable=False)
+
+def conv2d(x, w, b, stride, border_mode):
+    rows, cols, depth, filters = w.shape
+    view = windows(x, (rows, cols), stride, border_mode)
+    # windows are (C, kh, kw) ordered, kernels are stored as (kh, kw, C)
+    patches = view.transpose(0, 1, 2, 4, 5, 3).reshape(view.shape[:3] + (-1,))
+    return patches @ w.reshape(-1, filters) + b
+
+#---------------------------------------------------#
+# Pooling - with 'same' border mode the padding takes
+# no part, as in TensorFlow: it never wins the max and
+# the average is over the input cells of each window
+#---------------------------------------------------#
+def maxPool(x, pool_size, stride, border_mode):
+    return windows(x, pool_size, stride, border_mode, pad_value=-np.inf).max(axis=(4, 5))
+
+def averagePool(x, pool_size, stride, border_mode):
+    sums = windows(x, pool_size, stride, border_mode).sum(axis=(4, 5), dtype=np.float32)
+    if border_mode != 'same':
+        return sums / np.float32(pool_size[0] * pool_size[1])
+    ones = np.ones((1,) + x.shape[1:3] + (1,), dtype=np.float32)
+    return sums / windows(ones, pool_size, stride, border_mode).sum(axis=(4, 5))
+
+def elu(x, alpha=1.0):
+    return np.where(x > 0, x, alpha * (np.exp(np.minimum(x, 0)) - 1)).astype(np.float32)
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'elu': elu,
+}
+
+#---------------------------------------------------#
+# Quantize weights to int8 with a symmetric scale per
+# output channel (last axis), and the reverse
+#---------------------------------------------------#
+def quantizeWeights(w):
+    axes = tuple(range(w.ndim - 1))
+    scale = np.abs(w).max(axis=axes) / 127.0
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    return np.clip(np.round(w / scale), -127, 127).astype(np.int8), scale
+
+def dequantizeWeights(q, scale):
+    return q.astype(np.float32) * scale
+
+#---------------------------------------------------#
+# The exported model - a list of layer specs and their
+# dequantized float32 weights
+#---------------------------------------------------#
+class NumpySteeringModel():
+    def __init__(self, file_name):
+        with np.load(file_name) as data:
+            self.layers = json.loads(str(data['layers']))       # Layer specs in model order
+            self.metadata = json.loads(str(data['metadata']))   # Export, validation & latency details
+            self.weights = {}                                   # (W, b) of each conv & dense layer
+            for i, layer in enumerate(self.layers):
+                if layer['type'] in ('conv', 'dense'):
+                    self.weights[i] = (dequantizeWeights(data['w%d' % i], data['s%d' % i]),
+                                       data['b%d' % i].astype(np.float32))
+
+    def predict(self, batch):
+        x = np.asarray(batch, dtype=np.float32)
+        for i, layer in enumerate(self.layers):
+            kind = layer['type']
+            if kind == 'conv':
+                w, b = self.weights[i]
+                x = ACTIVATIONS[layer['activation']](conv2d(x, w, b, layer['stride'], layer['border_mode']))
+            elif kind == 'dense':
+                w, b = self.weights[i]
+                x = ACTIVATIONS[layer['activation']](x @ w + b)
+            elif kind == 'maxpool':
+                x = maxPool(x, layer['pool_size'], layer['stride'], layer['border_mode'])
+            elif kind == 'avgpool':
+                x = averagePool(x, layer['pool_size'], layer['stride'], layer['border_mode'])
+            elif kind == 'elu':
+                x = elu(x, layer['alpha'])
+            elif kind == 'activation':
+                x = ACTIVATIONS[layer['activation']](x)
+            elif kind == 'flatten':
+                x = x.reshape(x.shape[0], -1)
+        return x
@@ -0,0 +1,109 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import cv2
+from PIL import Image
+
+from inference import CROP_TOP, CROP_BOTTOM, ROWS, COLS, DEPTH, compilePredictFunction, loadKerasModel
+from numpy_model import NumpySteeringModel
+
+#---------------------------------------------------#
+# Define Batch Prediction Parameters
+#---------------------------------------------------#
+CSV_FILE_NAME = 'driving_log.csv'
+MODEL_FILE_NAME = 'model.json'
+BATCH_SIZE = 1024
+DECODE_THREADS = 4
+OUTPUT_FILE_NAME = 'predictions.npz'
+
+#---------------------------------------------------#
+# Read an image file, crop the sky & bonnet & resize
+# it - same deterministic preprocessing as drive.py
+#---------------------------------------------------#
+def readCroppedImage(file_name):
+    image = np.asarray(Image.open(file_name))
+    return cv2.resize(image[CROP_TOP:CROP_BOTTOM], (COLS, ROWS))
+
+#---------------------------------------------------#
+# Stream the frames of the image files given as
+# normalized float32 batches.  Images are decoded in
+# a thread pool while the previous batch is predicted
+#---------------------------------------------------#
+def imageBatches(file_names, batch_size=BATCH_SIZE, threads=DECODE_THREADS):
+    batch = np.empty((batch_size, ROWS, COLS, DEPTH), dtype=np.float32)
+    with ThreadPoolExecutor(threads) as pool:
+        chunks = [file_names[i:i+batch_size] for i in range(0, len(file_names), batch_size)]
+        pending = pool.map(readCroppedImage, chunks[0]) if chunks else None
+        for i, chunk in enumerate(chunks):
+            images = list(pending)
+            if i+1 < len(chunks):
+                pending = pool.map(readCroppedImage, chunks[i+1])
+            count = len(images)
+            np.multiply(np.stack(images), np.float32(1/255.0), out=batch[:count])
+            batch[:count] -= np.float32(0.5)
+            yield batch[:count]
+
+#---------------------------------------------------#
+# Predict the steering angle of every center image in
+# the driving log data frame
+#---------------------------------------------------#
+def predictLog(predict_function, df, img_dir, batch_size=BATCH_SIZE, threads=DECODE_THREADS):
+    file_names = [os.path.join(img_dir, name.strip()) for name in df['CenterImg']]
+    predicted = np.empty(len(file_names), dtype=np.float32)
+    start = 0
+    for batch in imageBatches(file_names, batch_size, threads):
+        predicted[start:start+len(batch)] = predict_function(batch)[:, 0]
+        start += len(batch)
+    return predicted
+
+#---------------------------------------------------#
+# Save the predictions in a columnar format, numpy
+# .npz (one array per column), parquet or csv by the
+# extension of the output file name
+#---------------------------------------------------#
+def saveResults(file_name, df, predicted):
+    columns = {'CenterImg': np.asarray(df['CenterImg'], dtype=str),
+               'SteerAngle': df['SteerAngle'].values.astype(np.float32),
+               'Predicted': predicted}
+    columns['Error'] = columns['Predicted'] - columns['SteerAngle']
+    if file_name.endswith('.npz'):
+        np.savez(file_name, **columns)
+    elif file_name.endswith('.parquet'):
+        pd.DataFrame(columns).to_parquet(file_name, index=False)
+    else:
+        pd.DataFrame(columns).to_csv(file_name, index=False)
+    return columns
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Offline steering prediction over a driving log')
+    parser.add_argument('--model', type=str, default=MODEL_FILE_NAME,
+    help='Path to model definition json (weights should be on the same path) or an exported .npz model.')
+    parser.add_argument('--log', type=str, default=CSV_FILE_NAME,
+    help='Driving log csv, image paths are relative to its folder.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--threads', type=int, default=DECODE_THREADS, help='Image decoding threads.')
+    parser.add_argument('--output', type=str, default=OUTPUT_FILE_NAME,
+    help='Output file, .npz, .parquet or .csv')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.log, header=0, usecols=[0, 3], names=['CenterImg', 'SteerAngle'])
+    if args.model.endswith('.npz'):
+        predict_function = NumpySteeringModel(args.model).predict
+    else:
+        predict_function = compilePredictFunction(loadKerasModel(args.model))
+
+    start = time.perf_counter()
+    predicted = predictLog(predict_function, df, os.path.dirname(os.path.abspath(args.log)),
+                           args.batch_size, args.threads)
+    elapsed = time.perf_counter() - start
+
+    columns = saveResults(args.output, df, predicted)
+    error = columns['Error']
+    print('Predicted %d frames in %.2fs (%.0f frames/s)' % (len(predicted), elapsed, len(predicted)/elapsed))
+    print('steering MAE=%.4f RMSE=%.4f' % (np.abs(error).mean(), np.sqrt((error**2).mean())))
+    print('Saved predictions to', args.output)
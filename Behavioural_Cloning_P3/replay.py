@@ -0,0 +1,123 @@
+import argparse
+import base64
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import socketio
+
+#---------------------------------------------------#
+# Define Replay Parameters
+#---------------------------------------------------#
+CSV_FILE_NAME = 'driving_log.csv'
+SERVER_URL = 'http://localhost:4567'
+FRAME_RATE = 15.0
+RESULT_FILE_NAME = 'replay_results.csv'
+
+#---------------------------------------------------#
+# Replay client for drive.py - reads the center images
+# of a driving log, sends them base64 encoded to the
+# 'telemetry' endpoint like the simulator does, and
+# records the time until the 'steer' reply together
+# with the predicted & recorded steering angles
+#---------------------------------------------------#
+class ReplayClient():
+    def __init__(self, url=SERVER_URL):
+        self.sio = socketio.Client()
+        self.sio.on('steer', self.onSteer)
+        self.url = url
+        self.sent_at = {}                   # Send time of each frame id
+        self.results = {}                   # (predicted steering, latency) of each answered frame id
+        self.lock = threading.Lock()
+
+    def onSteer(self, data):
+        received_at = time.perf_counter()
+        frame_id = data.get('frame_id')
+        if frame_id is None:
+            return
+        with self.lock:
+            self.results[frame_id] = (float(data['steering_angle']), received_at-self.sent_at[frame_id])
+
+    def sendFrame(self, frame_id, img_string, steering_angle, throttle, speed):
+        with self.lock:
+            self.sent_at[frame_id] = time.perf_counter()
+        self.sio.emit('telemetry', {'frame_id': frame_id, 'image': img_string,
+                                    'steering_angle': str(steering_angle),
+                                    'throttle': str(throttle), 'speed': str(speed)})
+
+    def replay(self, df, img_dir, rate=FRAME_RATE, timeout=5.0):
+        self.sio.connect(self.url)
+        interval = 1.0/rate if rate > 0 else 0.0
+        start = time.perf_counter()
+        for frame_id, row in enumerate(df.itertuples()):
+            with open(os.path.join(img_dir, row.CenterImg.strip()), 'rb') as f:
+                img_string = base64.b64encode(f.read()).decode('ascii')
+            delay = start + frame_id*interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.sendFrame(frame_id, img_string, row.SteerAngle, row.Throttle, row.Speed)
+
+        #---------------------------------------------------#
+        # Wait for the replies still outstanding
+        #---------------------------------------------------#
+        deadline = time.perf_counter() + timeout
+        while len(self.results) < len(self.sent_at) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.sio.disconnect()
+
+    #---------------------------------------------------#
+    # Frame level results - frames with no reply (dropped
+    # by the latest frame mode) have NaN prediction
+    #---------------------------------------------------#
+    def resultFrame(self, df):
+        predicted = np.full(len(self.sent_at), np.nan)
+        latency = np.full(len(self.sent_at), np.nan)
+        for frame_id, (steering_angle, seconds) in self.results.items():
+            predicted[frame_id] = steering_angle
+            latency[frame_id] = seconds*1000.0
+        result = pd.DataFrame({'CenterImg': df['CenterImg'].values[:len(predicted)],
+                               'SteerAngle': df['SteerAngle'].values[:len(predicted)],
+                               'Predicted': predicted, 'LatencyMs': latency})
+        result['Error'] = result['Predicted'] - result['SteerAngle']
+        return result
+
+def printSummary(result, elapsed):
+    answered = result.dropna()
+    print('frames sent=%d answered=%d dropped=%d in %.2fs' % (len(result), len(answered),
+          len(result)-len(answered), elapsed))
+    if len(answered) == 0:
+        return
+    latency = answered['LatencyMs'].values
+    print('latency ms p50=%.2f p90=%.2f p99=%.2f max=%.2f' % (np.percentile(latency, 50),
+          np.percentile(latency, 90), np.percentile(latency, 99), latency.max()))
+    error = answered['Error'].values
+    print('steering MAE=%.4f RMSE=%.4f' % (np.abs(error).mean(), np.sqrt((error**2).mean())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a driving log against drive.py')
+    parser.add_argument('--log', type=str, default=CSV_FILE_NAME,
+    help='Driving log csv, image paths are relative to its folder.')
+    parser.add_argument('--url', type=str, default=SERVER_URL, help='drive.py server url.')
+    parser.add_argument('--rate', type=float, default=FRAME_RATE,
+    help='Frames sent per second, 0 sends as fast as possible.')
+    parser.add_argument('--frames', type=int, default=None, help='Number of frames to replay.')
+    parser.add_argument('--output', type=str, default=RESULT_FILE_NAME, help='Per frame result csv.')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.log, header=0, usecols=[0, 3, 4, 6],
+                     names=['CenterImg', 'SteerAngle', 'Throttle', 'Speed'])
+    if args.frames is not None:
+        df = df.iloc[:args.frames]
+
+    client = ReplayClient(args.url)
+    start = time.perf_counter()
+    client.replay(df, os.path.dirname(os.path.abspath(args.log)), args.rate)
+    elapsed = time.perf_counter() - start
+
+    result = client.resultFrame(df)
+    printSummary(result, elapsed)
+    result.to_csv(args.output, index=False)
+    print('Saved per frame results to', args.output)
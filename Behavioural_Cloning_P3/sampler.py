@@ -0,0 +1,127 @@
+import pickle
+import numpy as np
+
+#---------------------------------------------------#
+# Define Sampler Parameters
+#---------------------------------------------------#
+STEER_BIN_COUNT = 25
+STEER_RANGE = (-1.0, 1.0)
+STEER_BIN_POWER = 0.5       # Default bin weight is bin_size**power, 1 keeps the log's distribution
+STEER_MAX_OVERSAMPLE = 5.0  # A record is drawn at most this many times its uniform share
+STEER_CAP_ITERATIONS = 100  # Cap & renormalize passes, each one caps at least one more bin
+
+#---------------------------------------------------#
+# Steering angle balanced sampler. Bins the steering
+# angles and draws sample indices with a configurable
+# weight per bin, so the near zero steering records
+# do not dominate every epoch.  The random state and
+# counters can be saved & restored to resume a run.
+#---------------------------------------------------#
+class SteeringSampler():
+    def __init__(self, steers, bin_weights=None, bin_count=STEER_BIN_COUNT, steer_range=STEER_RANGE,
+                 samples_per_epoch=None, seed=None, bin_power=STEER_BIN_POWER,
+                 max_oversample=STEER_MAX_OVERSAMPLE):
+        self.steers = np.asarray(steers, dtype=np.float32)
+        self.bin_edges = np.linspace(steer_range[0], steer_range[1], bin_count+1)  # Edges of the steering bins
+        self.bins = np.clip(np.digitize(self.steers, self.bin_edges)-1, 0, bin_count-1)  # Bin of each sample
+        self.bin_sizes = np.bincount(self.bins, minlength=bin_count)  # Number of samples in each bin
+        self.samples_per_epoch = samples_per_epoch  # Draws after which the epoch distribution is reported
+        self.rng = np.random.RandomState(seed)      # Random state used for all the draws
+        self.epoch = 0                              # Number of epochs completed
+        self.drawn = 0                              # Number of samples drawn in current epoch
+        self.drawn_per_bin = np.zeros(bin_count, dtype=np.int64)  # Samples drawn per bin in current epoch
+        self.history = []                           # Effective distribution of each completed epoch
+        self.bin_power = bin_power                  # Tempering of the default bin weights
+        self.max_oversample = max_oversample        # Cap on a record's share over uniform, None for no cap
+        self.setBinWeights(bin_weights)
+
+    #---------------------------------------------------#
+    # Weight of each bin, the whole bin is drawn with this
+    # relative probability.  None gives bin_size**power,
+    # between the log's own distribution (power 1) and a
+    # flat steering histogram (power 0).  The few records
+    # of sparse extreme bins would otherwise fill most of
+    # each epoch, so no record is drawn more than
+    # max_oversample times its uniform share
+    #---------------------------------------------------#
+    def setBinWeights(self, bin_weights=None):
+        if bin_weights is None:
+            bin_weights = self.bin_sizes.astype(np.float64) ** self.bin_power
+        bin_weights = np.asarray(bin_weights, dtype=np.float64)
+        if bin_weights.shape != self.bin_sizes.shape:
+            raise ValueError('Expected %d bin weights, got %d' % (len(self.bin_sizes), len(bin_weights)))
+        bin_weights = np.where(self.bin_sizes > 0, bin_weights, 0.0)
+        probs = bin_weights[self.bins] / self.bin_sizes[self.bins]
+        if probs.sum() <= 0:
+            raise ValueError('Bin weights select no samples')
+        self.bin_weights = bin_weights
+        self.probs = self.capOversampling(probs / probs.sum())
+
+    def capOversampling(self, probs):
+        if self.max_oversample is None:
+            return probs
+        cap = self.max_oversample / len(probs)
+        # Fewer selected records than 1/cap can not all stay under it, draw them uniformly
+        cap = max(cap, 1.0 / np.count_nonzero(probs))
+        # Capping renormalizes, which can lift other records over the cap
+        for i in range(STEER_CAP_ITERATIONS):
+            if probs.max() <= cap * (1 + 1e-9):
+                break
+            probs = np.minimum(probs, cap)
+            probs = probs / probs.sum()
+        return probs
+
+    #---------------------------------------------------#
+    # Draw indices (into the steers given) for one batch
+    #---------------------------------------------------#
+    def draw(self, batch_size):
+        indices = self.rng.choice(len(self.steers), size=batch_size, p=self.probs)
+        self.drawn_per_bin += np.bincount(self.bins[indices], minlength=len(self.bin_sizes))
+        self.drawn += batch_size
+        if self.samples_per_epoch is not None and self.drawn >= self.samples_per_epoch:
+            self.endEpoch()
+        return indices
+
+    #---------------------------------------------------#
+    # Record & print the distribution drawn in the epoch
+    #---------------------------------------------------#
+    def endEpoch(self):
+        distribution = self.drawn_per_bin / float(max(self.drawn, 1))
+        self.history.append(distribution)
+        self.epoch += 1
+        self.printDistribution(distribution, 'Epoch %d sampled steering distribution' % self.epoch)
+        self.drawn = 0
+        self.drawn_per_bin[:] = 0
+        return distribution
+
+    def printDistribution(self, distribution=None, title='Original steering distribution'):
+        if distribution is None:
+            distribution = self.bin_sizes / float(len(self.steers))
+        print(title)
+        for low, high, share in zip(self.bin_edges[:-1], self.bin_edges[1:], distribution):
+            print('  [%+.2f, %+.2f) %6.2f%%' % (low, high, 100*share))
+
+    #---------------------------------------------------#
+    # Save & restore the random state and counters, so a
+    # resumed run continues with the same sequence
+    #---------------------------------------------------#
+    def getState(self):
+        return {'rng': self.rng.get_state(), 'epoch': self.epoch, 'drawn': self.drawn,
+                'drawn_per_bin': self.drawn_per_bin.copy(), 'history': list(self.history),
+                'bin_weights': self.bin_weights.copy()}
+
+    def setState(self, state):
+        self.setBinWeights(state['bin_weights'])
+        self.rng.set_state(state['rng'])
+        self.epoch = state['epoch']
+        self.drawn = state['drawn']
+        self.drawn_per_bin = state['drawn_per_bin'].copy()
+        self.history = list(state['history'])
+
+    def saveState(self, file_name):
+        with open(file_name, 'wb') as f:
+            pickle.dump(self.getState(), f)
+
+    def loadState(self, file_name):
+        with open(file_name, 'rb') as f:
+            self.setState(pickle.load(f))
@@ -1,10 +1,31 @@
 import numpy as np
 import tensorflow as tf
+from alexnet_weights import sharedWeights, layerVariables
 
-net_data = np.load("bvlc-alexnet.npy", encoding="latin1").item()
+# Grouped convolution (conv2, conv4 & conv5) implementation:
+#   'split'  - a conv2d per group on split input & kernel, then concat
+#   'block'  - one conv2d with a block diagonal kernel made of the groups,
+#              one op per layer but group times the multiply-adds
+# TF 0.12, whose API this file is written against, has no grouped conv2d,
+# so there is no single op native path.  bench_grouped_conv.py times the
+# two against each other, 'split' stays the default until 'block' is
+# measured to win
+GROUPED_CONV = 'split'
 
 
-def conv(input, kernel, biases, k_h, k_w, c_o, s_h, s_w,  padding="VALID", group=1):
+def blockDiagonalKernel(kernel, c_i, group):
+    """
+    Full depth kernel with the kernel of group g on the input channels of group g and zeros
+    elsewhere - the zero weights only add zero terms, so the output equals the split path
+    up to float summation order
+    """
+    c_ig = c_i // group
+    kernel_groups = tf.split(3, group, kernel)
+    return tf.concat(3, [tf.pad(k, [[0, 0], [0, 0], [g*c_ig, (group-1-g)*c_ig], [0, 0]])
+                         for g, k in enumerate(kernel_groups)])
+
+
+def conv(input, kernel, biases, k_h, k_w, c_o, s_h, s_w,  padding="VALID", group=1, mode=None):
     '''
     From https://github.com/ethereon/caffe-tensorflow
     '''
@@ -13,8 +34,11 @@ def conv(input, kernel, biases, k_h, k_w, c_o, s_h, s_w,  padding="VALID", group
     assert c_o % group == 0
     convolve = lambda i, k: tf.nn.conv2d(i, k, [1, s_h, s_w, 1], padding=padding)
 
+    mode = mode or GROUPED_CONV
     if group == 1:
         conv = convolve(input, kernel)
+    elif mode == 'block':
+        conv = convolve(input, blockDiagonalKernel(kernel, int(c_i), group))
     else:
         input_groups = tf.split(3, group, input)
         kernel_groups = tf.split(3, group, kernel)
@@ -23,10 +47,14 @@ def conv(input, kernel, biases, k_h, k_w, c_o, s_h, s_w,  padding="VALID", group
     return tf.reshape(tf.nn.bias_add(conv, biases), [-1] + conv.get_shape().as_list()[1:])
 
 
-def AlexNet(features, feature_extract=False):
+def AlexNet(features, feature_extract=False, weights=None):
     """
     Builds an AlexNet model, loads pretrained weights
+
+    `weights` is an `AlexNetWeights`, the process wide shared one is used if not given
     """
+    net_data = weights if weights is not None else sharedWeights()
+
     # conv1
     # conv(11, 11, 96, 4, 4, padding='VALID', name='conv1')
     k_h = 11
@@ -34,8 +62,7 @@ def AlexNet(features, feature_extract=False):
     c_o = 96
     s_h = 4
     s_w = 4
-    conv1W = tf.Variable(net_data["conv1"][0])
-    conv1b = tf.Variable(net_data["conv1"][1])
+    conv1W, conv1b = layerVariables(net_data["conv1"])
     conv1_in = conv(features, conv1W, conv1b, k_h, k_w, c_o, s_h, s_w, padding="SAME", group=1)
     conv1 = tf.nn.relu(conv1_in)
 
@@ -64,8 +91,7 @@ def AlexNet(features, feature_extract=False):
     s_h = 1
     s_w = 1
     group = 2
-    conv2W = tf.Variable(net_data["conv2"][0])
-    conv2b = tf.Variable(net_data["conv2"][1])
+    conv2W, conv2b = layerVariables(net_data["conv2"])
     conv2_in = conv(maxpool1, conv2W, conv2b, k_h, k_w, c_o, s_h, s_w, padding="SAME", group=group)
     conv2 = tf.nn.relu(conv2_in)
 
@@ -94,8 +120,7 @@ def AlexNet(features, feature_extract=False):
     s_h = 1
     s_w = 1
     group = 1
-    conv3W = tf.Variable(net_data["conv3"][0])
-    conv3b = tf.Variable(net_data["conv3"][1])
+    conv3W, conv3b = layerVariables(net_data["conv3"])
     conv3_in = conv(maxpool2, conv3W, conv3b, k_h, k_w, c_o, s_h, s_w, padding="SAME", group=group)
     conv3 = tf.nn.relu(conv3_in)
 
@@ -107,8 +132,7 @@ def AlexNet(features, feature_extract=False):
     s_h = 1
     s_w = 1
     group = 2
-    conv4W = tf.Variable(net_data["conv4"][0])
-    conv4b = tf.Variable(net_data["conv4"][1])
+    conv4W, conv4b = layerVariables(net_data["conv4"])
     conv4_in = conv(conv3, conv4W, conv4b, k_h, k_w, c_o, s_h, s_w, padding="SAME", group=group)
     conv4 = tf.nn.relu(conv4_in)
 
@@ -120,8 +144,7 @@ def AlexNet(features, feature_extract=False):
     s_h = 1
     s_w = 1
     group = 2
-    conv5W = tf.Variable(net_data["conv5"][0])
-    conv5b = tf.Variable(net_data["conv5"][1])
+    conv5W, conv5b = layerVariables(net_data["conv5"])
     conv5_in = conv(conv4, conv5W, conv5b, k_h, k_w, c_o, s_h, s_w, padding="SAME", group=group)
     conv5 = tf.nn.relu(conv5_in)
 
@@ -136,14 +159,12 @@ def AlexNet(features, feature_extract=False):
 
     # fc6
     # fc(4096, name='fc6')
-    fc6W = tf.Variable(net_data["fc6"][0])
-    fc6b = tf.Variable(net_data["fc6"][1])
+    fc6W, fc6b = layerVariables(net_data["fc6"])
     fc6 = tf.nn.relu_layer(tf.reshape(maxpool5, [-1, int(np.prod(maxpool5.get_shape()[1:]))]), fc6W, fc6b)
 
     # fc7
     # fc(4096, name='fc7')
-    fc7W = tf.Variable(net_data["fc7"][0])
-    fc7b = tf.Variable(net_data["fc7"][1])
+    fc7W, fc7b = layerVariables(net_data["fc7"])
     fc7 = tf.nn.relu_layer(fc6, fc7W, fc7b)
 
     if feature_extract:
@@ -151,8 +172,7 @@ def AlexNet(features, feature_extract=False):
 
     # fc8
     # fc(1000, relu=False, name='fc8')
-    fc8W = tf.Variable(net_data["fc8"][0])
-    fc8b = tf.Variable(net_data["fc8"][1])
+    fc8W, fc8b = layerVariables(net_data["fc8"])
 
     logits = tf.nn.xw_plus_b(fc7, fc8W, fc8b)
     probabilities = tf.nn.softmax(logits)
@@ -0,0 +1,122 @@
+import os
+import json
+import argparse
+import numpy as np
+import tensorflow as tf
+
+#---------------------------------------------------#
+# Define Weight File Parameters
+#---------------------------------------------------#
+WEIGHTS_FILE_NAME = 'bvlc-alexnet.npy'
+WEIGHTS_DIR = 'bvlc-alexnet'
+MANIFEST_FILE_NAME = 'layers.json'
+
+#---------------------------------------------------#
+# Convert the pickled bvlc-alexnet.npy dict into one
+# plain .npy file per layer array (<layer>_W.npy &
+# <layer>_b.npy) plus a layers.json manifest, so the
+# layers can be memory mapped one by one.  The pickle
+# is read this one time only
+#---------------------------------------------------#
+def convertWeights(npy_file=WEIGHTS_FILE_NAME, weights_dir=WEIGHTS_DIR):
+    net_data = np.load(npy_file, encoding='latin1', allow_pickle=True).item()
+    if not os.path.isdir(weights_dir):
+        os.makedirs(weights_dir)
+    manifest = {}
+    for name, (W, b) in sorted(net_data.items()):
+        np.save(os.path.join(weights_dir, name + '_W.npy'), np.ascontiguousarray(W, dtype=np.float32))
+        np.save(os.path.join(weights_dir, name + '_b.npy'), np.ascontiguousarray(b, dtype=np.float32))
+        manifest[name] = {'W': list(W.shape), 'b': list(b.shape)}
+    with open(os.path.join(weights_dir, MANIFEST_FILE_NAME), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return weights_dir
+
+#---------------------------------------------------#
+# Lazily loaded AlexNet weights.  Nothing is read when
+# the object is made; a layer is memory mapped from
+# the converted folder the first time it is asked for
+# and cached, so only the layers a graph uses are ever
+# read (fc8 is not with feature_extract=True).  The
+# folder is converted from the .npy pickle first if it
+# does not exist yet.  One object can be shared by any
+# number of graphs, and processes mapping the same
+# files share their pages
+#---------------------------------------------------#
+class AlexNetWeights():
+    def __init__(self, weights_dir=WEIGHTS_DIR, npy_file=WEIGHTS_FILE_NAME):
+        self.weights_dir = weights_dir      # Converted per layer weights folder
+        self.npy_file = npy_file            # Original pickled weights
+        self.layers = {}                    # Cache of layer name -> (W, b) memory maps
+
+    def _convertIfMissing(self):
+        if not os.path.exists(os.path.join(self.weights_dir, MANIFEST_FILE_NAME)):
+            print('Converting', self.npy_file, 'to', self.weights_dir)
+            convertWeights(self.npy_file, self.weights_dir)
+
+    def __getitem__(self, name):
+        if name not in self.layers:
+            self._convertIfMissing()
+            self.layers[name] = (np.load(os.path.join(self.weights_dir, name + '_W.npy'), mmap_mode='r'),
+                                 np.load(os.path.join(self.weights_dir, name + '_b.npy'), mmap_mode='r'))
+        return self.layers[name]
+
+    #---------------------------------------------------#
+    # Map the given layers (all of them by default) up
+    # front, e.g. before forking worker processes
+    #---------------------------------------------------#
+    def cache(self, names=None):
+        if names is None:
+            self._convertIfMissing()
+            with open(os.path.join(self.weights_dir, MANIFEST_FILE_NAME)) as f:
+                names = sorted(json.load(f))
+        for name in names:
+            self[name]
+        return self
+
+    #---------------------------------------------------#
+    # Drop the cached maps.  Graphs already built keep
+    # the arrays they were given until they are freed
+    #---------------------------------------------------#
+    def release(self):
+        self.layers = {}
+
+#---------------------------------------------------#
+# Process wide weights used by AlexNet() when it is
+# not given any, created on first use
+#---------------------------------------------------#
+_shared_weights = None
+
+def sharedWeights():
+    global _shared_weights
+    if _shared_weights is None:
+        _shared_weights = AlexNetWeights()
+    return _shared_weights
+
+def releaseSharedWeights():
+    global _shared_weights
+    if _shared_weights is not None:
+        _shared_weights.release()
+    _shared_weights = None
+
+#---------------------------------------------------#
+# Variable initialized straight from a (mapped) array.
+# tf.Variable(array) would embed the array in the graph
+# as a constant - a second copy of every layer - here
+# the initializer reads the array only when run
+#---------------------------------------------------#
+def arrayVariable(array):
+    initial_value = tf.py_func(lambda: np.asarray(array), [], tf.float32)
+    initial_value.set_shape(array.shape)
+    return tf.Variable(initial_value)
+
+def layerVariables(layer):
+    W, b = layer
+    return arrayVariable(W), arrayVariable(b)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the AlexNet weights to memory mappable per layer files')
+    parser.add_argument('--weights', type=str, default=WEIGHTS_FILE_NAME, help='Pickled weights .npy file.')
+    parser.add_argument('--output', type=str, default=WEIGHTS_DIR, help='Output folder.')
+    args = parser.parse_args()
+    print('Converted to', convertWeights(args.weights, args.output))
@@ -0,0 +1,71 @@
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from alexnet import conv
+
+#---------------------------------------------------#
+# Define Benchmark Parameters
+#---------------------------------------------------#
+BATCH_SIZE = 64
+WARMUP_RUNS = 3
+TIMED_RUNS = 20
+
+# name, input (h, w, c), kernel (h, w, c / group, c_o), group - as in AlexNet
+LAYERS = [('conv2', (27, 27, 96), (5, 5, 48, 256), 2),
+          ('conv4', (13, 13, 384), (3, 3, 192, 384), 2),
+          ('conv5', (13, 13, 384), (3, 3, 192, 256), 2)]
+
+def timeRuns(sess, op, warmup=WARMUP_RUNS, runs=TIMED_RUNS):
+    for i in range(warmup):
+        sess.run(op)
+    times = np.empty(runs)
+    for i in range(runs):
+        start = time.perf_counter()
+        sess.run(op)
+        times[i] = time.perf_counter() - start
+    return 1000*np.median(times)
+
+#---------------------------------------------------#
+# Time the forward pass of one grouped conv layer in
+# every mode & compare it to the split path.  'block'
+# does group times the multiply-adds of 'split', it
+# only wins where the saved op overhead outweighs that
+#---------------------------------------------------#
+def benchmarkLayer(name, input_shape, kernel_shape, group, modes, batch_size=BATCH_SIZE, runs=TIMED_RUNS):
+    rng = np.random.RandomState(0)
+    images = rng.standard_normal((batch_size,) + input_shape).astype(np.float32)
+    kernel = (0.05*rng.standard_normal(kernel_shape)).astype(np.float32)
+    biases = np.zeros(kernel_shape[-1], dtype=np.float32)
+
+    results = []
+    graph = tf.Graph()
+    with graph.as_default():
+        # inputs live in variables so the runs time the conv only, not feeding
+        x, k, b = tf.Variable(images), tf.Variable(kernel), tf.Variable(biases)
+        ops = [conv(x, k, b, kernel_shape[0], kernel_shape[1], kernel_shape[-1], 1, 1,
+                    padding="SAME", group=group, mode=mode) for mode in modes]
+        init = tf.initialize_all_variables()
+    with tf.Session(graph=graph) as sess:
+        sess.run(init)
+        reference = sess.run(ops[0])
+        for mode, op in zip(modes, ops):
+            max_diff = float(np.abs(sess.run(op) - reference).max())
+            results.append((name, mode, timeRuns(sess, op, runs=runs), max_diff))
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the grouped convolution paths of alexnet.py')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--runs', type=int, default=TIMED_RUNS)
+    args = parser.parse_args()
+
+    modes = ['split', 'block']
+    print('%-6s %-7s %10s %14s' % ('layer', 'mode', 'median_ms', 'max_abs_diff'))
+    for name, input_shape, kernel_shape, group in LAYERS:
+        for layer, mode, ms, diff in benchmarkLayer(name, input_shape, kernel_shape, group, modes,
+                                                    args.batch_size, args.runs):
+            print('%-6s %-7s %10.2f %14.3g' % (layer, mode, ms, diff))
@@ -0,0 +1,166 @@
+import os
+import json
+import pickle
+import numpy as np
+
+#---------------------------------------------------#
+# Memory mapped dataset store.  A train.p/test.p
+# pickle is converted once into a folder of .npy
+# arrays (features, labels & the record indices
+# grouped by class) plus an index.json, and then
+# opened as read only memory maps.  Subsets, splits
+# and shuffles are only index arrays over the maps,
+# records are read when a batch is sliced out
+#---------------------------------------------------#
+FEATURES_FILE_NAME = 'features.npy'
+LABELS_FILE_NAME = 'labels.npy'
+CLASS_ORDER_FILE_NAME = 'class_order.npy'
+INDEX_FILE_NAME = 'index.json'
+
+#---------------------------------------------------#
+# Store folder used for a pickle file by default,
+# e.g. traffic-signs-data/train.p -> train_store
+#---------------------------------------------------#
+def storeDirFor(pickle_file):
+    return os.path.splitext(pickle_file)[0] + '_store'
+
+#---------------------------------------------------#
+# Convert the pickle into the store folder - done once
+#---------------------------------------------------#
+def convertPickle(pickle_file, store_dir=None):
+    store_dir = store_dir or storeDirFor(pickle_file)
+    with open(pickle_file, mode='rb') as f:
+        data = pickle.load(f)
+    features, labels = np.asarray(data['features']), np.asarray(data['labels'])
+    data = None
+
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    np.save(os.path.join(store_dir, FEATURES_FILE_NAME), features)
+    np.save(os.path.join(store_dir, LABELS_FILE_NAME), labels)
+
+    #---------------------------------------------------#
+    # Record indices sorted by class, the records of
+    # class c are class_order[offsets[c]:offsets[c+1]]
+    #---------------------------------------------------#
+    class_order = np.argsort(labels, kind='mergesort')
+    counts = np.bincount(labels)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    np.save(os.path.join(store_dir, CLASS_ORDER_FILE_NAME), class_order)
+
+    index = {'source': os.path.basename(pickle_file), 'count': int(len(labels)),
+             'feature_shape': list(features.shape[1:]), 'feature_dtype': str(features.dtype),
+             'n_classes': int(len(counts)), 'class_counts': counts.tolist(),
+             'class_offsets': offsets.tolist()}
+    with open(os.path.join(store_dir, INDEX_FILE_NAME), 'w') as f:
+        json.dump(index, f, indent=1)
+    return store_dir
+
+#---------------------------------------------------#
+# Open the store of the pickle file, converting the
+# pickle first if the store does not exist yet
+#---------------------------------------------------#
+def loadStore(pickle_file, store_dir=None):
+    store_dir = store_dir or storeDirFor(pickle_file)
+    if not os.path.exists(os.path.join(store_dir, INDEX_FILE_NAME)):
+        print('Converting', pickle_file, 'to', store_dir)
+        convertPickle(pickle_file, store_dir)
+    return DatasetStore(store_dir)
+
+#---------------------------------------------------#
+# Pick fraction of the records of every class
+#---------------------------------------------------#
+def stratifiedSelect(labels, fraction, rng=np.random):
+    selected = []
+    for c in np.unique(labels):
+        positions = rng.permutation(np.nonzero(labels == c)[0])
+        selected.append(positions[:int(round(fraction*len(positions)))])
+    selected = np.sort(np.concatenate(selected))
+    rest = np.setdiff1d(np.arange(len(labels)), selected, assume_unique=True)
+    return selected, rest
+
+#---------------------------------------------------#
+# Array like over the rows of array at given indices.
+# Supports len, shape & indexing by int/slice/array
+# like the numpy array it stands for, so the existing
+# batch slicing code works on it unchanged
+#---------------------------------------------------#
+class IndexedArray():
+    def __init__(self, array, indices):
+        self.array = array                  # Underlying (memory mapped) array
+        self.indices = indices              # Rows of the array in this view
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def shape(self):
+        return (len(self.indices),) + self.array.shape[1:]
+
+    @property
+    def dtype(self):
+        return self.array.dtype
+
+    def __getitem__(self, key):
+        return self.array[self.indices[key]]
+
+    def __array__(self, dtype=None):
+        return np.asarray(self.array[self.indices], dtype=dtype)
+
+#---------------------------------------------------#
+# A set of records of the store, as index array only
+#---------------------------------------------------#
+class DatasetView():
+    def __init__(self, store, indices):
+        self.store = store
+        self.indices = np.asarray(indices)
+        self.features = IndexedArray(store.all_features, self.indices)
+        self.labels = IndexedArray(store.all_labels, self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def labelArray(self):
+        return self.store.all_labels[self.indices]
+
+    def shuffled(self, rng=np.random):
+        return DatasetView(self.store, rng.permutation(self.indices))
+
+    def stratifiedSubset(self, fraction, seed=None):
+        selected, rest = stratifiedSelect(self.labelArray(), fraction, np.random.RandomState(seed))
+        return DatasetView(self.store, self.indices[selected])
+
+    #---------------------------------------------------#
+    # Split into (train, validation) views, keeping the
+    # class balance when stratified
+    #---------------------------------------------------#
+    def split(self, validation_fraction, seed=None, stratified=True):
+        rng = np.random.RandomState(seed)
+        if stratified:
+            valid, train = stratifiedSelect(self.labelArray(), validation_fraction, rng)
+        else:
+            order = rng.permutation(len(self.indices))
+            n_valid = int(round(validation_fraction*len(order)))
+            valid, train = np.sort(order[:n_valid]), np.sort(order[n_valid:])
+        return DatasetView(self.store, self.indices[train]), DatasetView(self.store, self.indices[valid])
+
+#---------------------------------------------------#
+# The whole store - memory maps & per class indices
+#---------------------------------------------------#
+class DatasetStore(DatasetView):
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, INDEX_FILE_NAME)) as f:
+            self.index = json.load(f)
+        self.store_dir = store_dir
+        self.all_features = np.load(os.path.join(store_dir, FEATURES_FILE_NAME), mmap_mode='r')
+        self.all_labels = np.load(os.path.join(store_dir, LABELS_FILE_NAME), mmap_mode='r')
+        self.class_order = np.load(os.path.join(store_dir, CLASS_ORDER_FILE_NAME), mmap_mode='r')
+        self.class_offsets = self.index['class_offsets']
+        self.n_classes = self.index['n_classes']
+        DatasetView.__init__(self, self, np.arange(self.index['count']))
+
+    #---------------------------------------------------#
+    # Indices of the records of class c (a view)
+    #---------------------------------------------------#
+    def classIndices(self, c):
+        return self.class_order[self.class_offsets[c]:self.class_offsets[c+1]]
@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+import numpy as np
+from numpy.lib.format import open_memmap
+
+#---------------------------------------------------#
+# Define Feature Bank Parameters
+#---------------------------------------------------#
+FEATURE_BANK_FILE_NAME = 'fc7_features.npy'
+SOURCE_FILE_SUFFIX = '.source.json'
+EXTRACT_BATCH_SIZE = 256
+CHECKSUM_CHUNK_SIZE = 4096
+
+#---------------------------------------------------#
+# What a bank was built from - the image count & an
+# md5 of the image bytes, and the size & mtime of each
+# AlexNet weight file.  Kept in a json next to the
+# bank, a different source means a stale bank
+#---------------------------------------------------#
+def sourceFileFor(file_name):
+    return file_name + SOURCE_FILE_SUFFIX
+
+def imagesChecksum(images, chunk_size=CHECKSUM_CHUNK_SIZE):
+    md5 = hashlib.md5()
+    for offset in range(0, len(images), chunk_size):
+        md5.update(np.ascontiguousarray(images[offset:offset+chunk_size]).tobytes())
+    return md5.hexdigest()
+
+def weightsSignature(weights):
+    folder = weights.weights_dir
+    return {name: [os.path.getsize(os.path.join(folder, name)), int(os.path.getmtime(os.path.join(folder, name)))]
+            for name in sorted(os.listdir(folder))}
+
+def bankSource(images, weights):
+    return {'count': len(images), 'images_md5': imagesChecksum(images), 'weights': weightsSignature(weights)}
+
+#---------------------------------------------------#
+# Run the frozen AlexNet once over all the images and
+# keep the fc7 activations in a float16 .npy memory
+# map, row i holding the features of image i.  Written
+# to a temporary file first, so an interrupted run
+# never leaves a partial bank behind.  The source json
+# is written last, only for a complete bank
+#---------------------------------------------------#
+def buildFeatureBank(sess, x, fc7, images, source, file_name=FEATURE_BANK_FILE_NAME,
+                     batch_size=EXTRACT_BATCH_SIZE):
+    tmp_file_name = file_name + '.tmp.npy'
+    bank = open_memmap(tmp_file_name, mode='w+', dtype=np.float16,
+                       shape=(len(images), fc7.get_shape().as_list()[-1]))
+    for offset in range(0, len(images), batch_size):
+        batch = images[offset:offset+batch_size]
+        bank[offset:offset+len(batch)] = sess.run(fc7, feed_dict={x: batch})
+    bank.flush()
+    del bank
+    os.replace(tmp_file_name, file_name)
+    with open(sourceFileFor(file_name) + '.tmp', 'w') as f:
+        json.dump(source, f, indent=1)
+    os.replace(sourceFileFor(file_name) + '.tmp', sourceFileFor(file_name))
+
+#---------------------------------------------------#
+# Open the bank read only, building it first if it is
+# missing or its source differs from the images and
+# AlexNet weights given (a rebuilt store, other images
+# of the same count, or new weights)
+#---------------------------------------------------#
+def loadFeatureBank(sess, x, fc7, images, weights, file_name=FEATURE_BANK_FILE_NAME,
+                    batch_size=EXTRACT_BATCH_SIZE):
+    source = bankSource(images, weights)
+    if os.path.exists(file_name) and os.path.exists(sourceFileFor(file_name)):
+        with open(sourceFileFor(file_name)) as f:
+            if json.load(f) == source:
+                return np.load(file_name, mmap_mode='r')
+        print('fc7 feature bank', file_name, 'is stale')
+    print('Building fc7 feature bank', file_name, 'of', len(images), 'images')
+    buildFeatureBank(sess, x, fc7, images, source, file_name, batch_size)
+    return np.load(file_name, mmap_mode='r')
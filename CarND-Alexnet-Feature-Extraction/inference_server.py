@@ -0,0 +1,220 @@
+import argparse
+import base64
+import io
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+from scipy.misc import imread, imresize
+
+from alexnet import AlexNet
+from caffe_classes import class_names
+
+#---------------------------------------------------#
+# Define Server Parameters
+#---------------------------------------------------#
+PORT = 8000
+MAX_BATCH = 64
+LATENCY_BUDGET_MS = 10
+TOP_K = 5
+SIGN_HEAD_FILE_NAME = 'sign_head.npz'
+
+#---------------------------------------------------#
+# AlexNet graph & session built once.  'imagenet'
+# classifies 227x227 images into the 1000 caffe
+# classes, 'signs' resizes 32x32 sign images in the
+# graph & classifies fc7 with the traffic sign head
+# saved by train_feature_extraction.py
+#---------------------------------------------------#
+class AlexNetClassifier():
+    def __init__(self, mode='imagenet', head_file=SIGN_HEAD_FILE_NAME):
+        self.mode = mode
+        self.size = 227 if mode == 'imagenet' else 32
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.x = tf.placeholder(tf.float32, (None, self.size, self.size, 3))
+            if mode == 'imagenet':
+                self.probs = AlexNet(self.x, feature_extract=False)
+                self.labels = list(class_names)
+            else:
+                fc7 = AlexNet(tf.image.resize_images(self.x, 227, 227), feature_extract=True)
+                with np.load(head_file) as head:
+                    logits = tf.nn.xw_plus_b(fc7, tf.constant(head['W']), tf.constant(head['b']))
+                self.probs = tf.nn.softmax(logits)
+                self.labels = list(pd.read_csv('signnames.csv')['SignName'])
+            init = tf.initialize_all_variables()
+        self.sess = tf.Session(graph=self.graph)
+        self.sess.run(init)
+
+    #---------------------------------------------------#
+    # Decode an encoded image & resize it to the input
+    # size.  'imagenet' subtracts the image mean like the
+    # lab scripts do; the sign head was trained on fc7 of
+    # the raw 0-255 pixels, so 'signs' keeps them as is
+    #---------------------------------------------------#
+    def decodeImage(self, data):
+        image = imread(io.BytesIO(data))[:, :, :3]
+        if image.shape[:2] != (self.size, self.size):
+            image = imresize(image, (self.size, self.size))
+        image = image.astype(np.float32)
+        if self.mode == 'imagenet':
+            image -= np.mean(image)
+        return image
+
+    def predict(self, batch):
+        return self.sess.run(self.probs, feed_dict={self.x: batch})
+
+#---------------------------------------------------#
+# Dynamic micro-batching.  Concurrent requests queue
+# their images; the batching thread takes the first
+# waiting request and keeps adding the ones arriving
+# within the latency budget, up to max_batch images,
+# then runs them through the model in one pass
+#---------------------------------------------------#
+class MicroBatcher():
+    def __init__(self, predict, max_batch=MAX_BATCH, latency_budget_ms=LATENCY_BUDGET_MS):
+        self.predict = predict
+        self.max_batch = max_batch
+        self.latency_budget = latency_budget_ms / 1000.0
+        self.requests = queue.Queue()
+        self.batches = 0                    # Model passes run
+        self.images = 0                     # Images classified
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    #---------------------------------------------------#
+    # Classify the images of one request, blocks until
+    # its batch has run
+    #---------------------------------------------------#
+    def submit(self, images):
+        request = {'images': images, 'done': threading.Event(), 'result': None, 'error': None}
+        self.requests.put(request)
+        request['done'].wait()
+        if request['error'] is not None:
+            raise request['error']
+        return request['result']
+
+    def _collect(self):
+        pending = [self.requests.get()]
+        count = len(pending[0]['images'])
+        deadline = time.perf_counter() + self.latency_budget
+        while count < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending.append(request)
+            count += len(request['images'])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            try:
+                probs = self.predict(np.concatenate([request['images'] for request in pending]))
+                start = 0
+                for request in pending:
+                    request['result'] = probs[start:start+len(request['images'])]
+                    start += len(request['images'])
+                self.batches += 1
+                self.images += start
+            except Exception as e:
+                for request in pending:
+                    request['error'] = e
+            for request in pending:
+                request['done'].set()
+
+def topK(probs, labels, k=TOP_K):
+    ids = np.argsort(probs, axis=1)[:, ::-1][:, :k]
+    return [[{'class_id': int(c), 'label': labels[c], 'probability': float(p[c])} for c in row]
+            for p, row in zip(probs, ids)]
+
+#---------------------------------------------------#
+# HTTP interface
+#   POST /classify  {"images": [base64 encoded image, ...], "k": 5}
+#                   -> {"predictions": [[{class_id, label, probability}, ...], ...]}
+#   GET  /stats     -> model passes & images classified
+#---------------------------------------------------#
+class ClassifyHandler(BaseHTTPRequestHandler):
+    classifier = None
+    batcher = None
+
+    def sendJson(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != '/stats':
+            return self.sendJson(404, {'error': 'not found'})
+        self.sendJson(200, {'mode': self.classifier.mode, 'batches': self.batcher.batches,
+                            'images': self.batcher.images})
+
+    def do_POST(self):
+        if self.path != '/classify':
+            return self.sendJson(404, {'error': 'not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+            k = body.get('k', TOP_K)
+            if isinstance(k, bool) or not isinstance(k, int) or not 1 <= k <= len(self.classifier.labels):
+                raise ValueError('k must be an integer from 1 to %d, got %r' % (len(self.classifier.labels), k))
+            images = np.stack([self.classifier.decodeImage(base64.b64decode(image)) for image in body['images']])
+        except Exception as e:
+            return self.sendJson(400, {'error': 'bad request: %s' % e})
+        start = time.perf_counter()
+        probs = self.batcher.submit(images)
+        self.sendJson(200, {'predictions': topK(probs, self.classifier.labels, k),
+                            'ms': 1000*(time.perf_counter() - start)})
+
+    def address_string(self):
+        # unix socket clients have no (host, port) address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Persistent AlexNet classification server')
+    parser.add_argument('--mode', type=str, default='imagenet', choices=['imagenet', 'signs'])
+    parser.add_argument('--head', type=str, default=SIGN_HEAD_FILE_NAME, help='Traffic sign head weights (signs mode).')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--socket', type=str, default=None, help='Serve on this unix socket instead of the port.')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--latency-budget', type=float, default=LATENCY_BUDGET_MS, help='Batching wait in ms.')
+    args = parser.parse_args()
+
+    ClassifyHandler.classifier = AlexNetClassifier(args.mode, args.head)
+    ClassifyHandler.batcher = MicroBatcher(ClassifyHandler.classifier.predict, args.max_batch, args.latency_budget)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, ClassifyHandler)
+        print('Serving', args.mode, 'on', args.socket)
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', args.port), ClassifyHandler)
+        print('Serving', args.mode, 'on port', args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
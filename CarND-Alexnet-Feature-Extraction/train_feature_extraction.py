@@ -1,22 +1,22 @@
 import time
-import pickle
 import tensorflow as tf
-from sklearn.cross_validation import train_test_split
-from sklearn.utils import shuffle
 from alexnet import AlexNet
+from alexnet_weights import sharedWeights
+from dataset_store import loadStore, IndexedArray
+from feature_bank import loadFeatureBank
+from evaluation import Evaluator, saveReport, printReport
 from scipy.misc import imread
 import pandas as pd
 from tqdm import tqdm
 import numpy as np
 
 # TODO: Load traffic signs data.
+# The pickle is converted once to a .npy store & opened memory mapped
 training_file = 'train.p'
-with open(training_file, mode='rb') as f:
-    train = pickle.load(f)
-X_train, y_train = train['features'], train['labels']
+train = loadStore(training_file)
 
-n_train = len(X_train)
-image_shape = X_train[0].shape
+n_train = len(train)
+image_shape = tuple(train.index['feature_shape'])
 nb_classes = 43
 
 print("Number of training examples =", n_train)
@@ -26,11 +26,12 @@ print("Number of classes =", nb_classes)
 sign_names = pd.read_csv('signnames.csv')
 
 # TODO: Split data into training and validation sets.
-X_train, X_validation, y_train, y_validation = train_test_split(X_train, y_train, test_size=0.01, random_state=42)
-X_train, X_discard, y_train, y_discard = train_test_split(X_train, y_train, test_size=0.9, random_state=42)
+# 1% for validation, as index views over the store. With the fc7 feature bank
+# an epoch is cheap, so the head trains on all of the rest
+train_set, validation_set = train.split(0.01, seed=42)
 
-n_train = len(X_train)
-n_validation = len(X_validation)
+n_train = len(train_set)
+n_validation = len(validation_set)
 
 print("Number of training examples =", n_train)
 print("Number of validation examples =", n_validation)
@@ -48,12 +49,15 @@ fc7 = AlexNet(x_resized, feature_extract=True)
 # past this point, keeping the weights before and up to `fc7` frozen.
 # This also makes training faster, less work to do!
 fc7 = tf.stop_gradient(fc7)
+# The head reads fc7 from AlexNet by default, training & evaluation feed the
+# cached fc7 vectors of the feature bank instead, so AlexNet is not run there
+fc7_in = tf.placeholder_with_default(fc7, (None, fc7.get_shape().as_list()[-1]))
 
 # TODO: Add the final layer for traffic sign classification.
 shape = (fc7.get_shape().as_list()[-1], nb_classes)
 fc8W = tf.Variable(tf.truncated_normal(shape, stddev=1e-2))
 fc8b = tf.Variable(tf.zeros(nb_classes))
-logits = tf.nn.xw_plus_b(fc7, fc8W, fc8b)
+logits = tf.nn.xw_plus_b(fc7_in, fc8W, fc8b)
 probs = tf.nn.softmax(logits)
 
 
@@ -67,18 +71,12 @@ cross_entropy = tf.nn.softmax_cross_entropy_with_logits(logits, one_hot_y)
 loss_operation = tf.reduce_mean(cross_entropy)
 optimizer = tf.train.AdamOptimizer(learning_rate = l_rate)
 training_operation = optimizer.minimize(loss_operation)
-correct_prediction = tf.equal(tf.argmax(logits, 1), tf.argmax(one_hot_y, 1))
-accuracy_operation = tf.reduce_mean(tf.cast(correct_prediction, tf.float32))
+# One top-5 pass gives accuracy, top-5 accuracy, confusion matrix & per class
+# precision/recall together, over the cached fc7 vectors
+evaluator = Evaluator(logits, fc7_in, n_classes=nb_classes)
 
 def evaluate(X_data, y_data):
-    num_examples = len(X_data)
-    total_accuracy = 0
-    sess = tf.get_default_session()
-    for offset in range(0, num_examples, BATCH_SIZE):
-        batch_x, batch_y = X_data[offset:offset+BATCH_SIZE], y_data[offset:offset+BATCH_SIZE]
-        accuracy = sess.run(accuracy_operation, feed_dict={x: batch_x, y: batch_y})
-        total_accuracy += (accuracy * len(batch_x))
-    return total_accuracy / num_examples
+    return evaluator.evaluate(X_data, y_data)['accuracy']
 
 def predictTestImages():
     print('Predicting the test images')
@@ -107,18 +105,28 @@ def predictTestImages():
 with tf.Session() as sess:
     #sess.run(tf.global_variables_initializer())
     sess.run(tf.initialize_all_variables())
-    num_examples = len(X_train)
+    num_examples = len(train_set)
+
+    # AlexNet runs once over the whole store, fc7 rows follow the store order
+    bank = loadFeatureBank(sess, x, fc7, train.features, sharedWeights())
+    X_validation, y_validation = IndexedArray(bank, validation_set.indices), validation_set.labels
     
     print("Training.........................")
     print()
     for i in tqdm(range(EPOCHS)):
-        X_train, y_train = shuffle(X_train, y_train)
+        train_set = train_set.shuffled()
+        X_train, y_train = IndexedArray(bank, train_set.indices), train_set.labels
         for offset in range(0, num_examples, BATCH_SIZE):
             end = offset + BATCH_SIZE
             batch_x, batch_y = X_train[offset:end], y_train[offset:end]
-            sess.run(training_operation, feed_dict={x: batch_x, y: batch_y})
+            sess.run(training_operation, feed_dict={fc7_in: batch_x, y: batch_y})
             
         validation_accuracy = evaluate(X_validation, y_validation)
         print("EPOCH {} ...".format(i+1), "Validation Accuracy = {:.3f}".format(validation_accuracy))
     print("Completed Training.................")
+    validation_report = evaluator.evaluate(X_validation, y_validation)
+    saveReport('validation_report.json', validation_report, sign_names['SignName'])
+    printReport(validation_report, list(sign_names['SignName']))
+    # Trained head, served by inference_server.py --mode signs
+    np.savez('sign_head.npz', W=sess.run(fc8W), b=sess.run(fc8b))
     predictTestImages()   
@@ -0,0 +1,105 @@
+import numpy as np
+import cv2
+from multiprocessing import Pool
+
+#---------------------------------------------------#
+# Define Augmentation Parameters
+#---------------------------------------------------#
+CHUNK_SIZE = 4096
+SHEAR_SRC_PTS = np.float64([[5, 5], [20, 5], [5, 20]])
+SHEAR_SRC_INV = np.linalg.inv(np.hstack([SHEAR_SRC_PTS, np.ones((3, 1))]))
+
+#---------------------------------------------------#
+# Random rotation, translation & shear of generateImg
+# in the notebook, composed into one 2x3 affine matrix
+# per image.  The three warps of generateImg are done
+# one after other, so the composed matrix is
+# Shear x Translation x Rotation
+#---------------------------------------------------#
+def affineMatrices(count, rows, cols, rng=np.random):
+    rot_range = rng.randint(10, 50, size=count)
+    shear_range = rng.randint(1, 10, size=count)
+    trans_range = rng.randint(1, 5, size=count)
+
+    # Rotation, same matrix as cv2.getRotationMatrix2D about the image center
+    rot_angle = np.deg2rad(rng.normal(rot_range) - rot_range/2)
+    a, b = np.cos(rot_angle), np.sin(rot_angle)
+    cx, cy = cols/2, rows/2
+    rot_M = np.zeros((count, 3, 3))
+    rot_M[:, 0] = np.stack([a, b, (1-a)*cx - b*cy], axis=1)
+    rot_M[:, 1] = np.stack([-b, a, b*cx + (1-a)*cy], axis=1)
+    rot_M[:, 2, 2] = 1
+
+    # Translation
+    trans_M = np.tile(np.eye(3), (count, 1, 1))
+    trans_M[:, 0, 2] = trans_range*rng.uniform(size=count) - trans_range/2
+    trans_M[:, 1, 2] = trans_range*rng.uniform(size=count) - trans_range/2
+
+    # Shear, cv2.getAffineTransform(pts1, pts2) solved for all images at once
+    pt1 = 5 + shear_range*rng.uniform(size=count) - shear_range/2
+    pt2 = 20 + shear_range*rng.uniform(size=count) - shear_range/2
+    pts2 = np.stack([np.stack([pt1, np.full(count, 5.0)], axis=1),
+                     np.stack([pt2, pt1], axis=1),
+                     np.stack([np.full(count, 5.0), pt2], axis=1)], axis=1)
+    shear_M = np.tile(np.eye(3), (count, 1, 1))
+    shear_M[:, :2] = np.matmul(SHEAR_SRC_INV, pts2).transpose(0, 2, 1)
+
+    return np.matmul(np.matmul(shear_M, trans_M), rot_M)[:, :2]
+
+#---------------------------------------------------#
+# Warp each source image with its matrix into out
+#---------------------------------------------------#
+def warpImages(images, matrices, out):
+    rows, cols = images.shape[1:3]
+    for i in range(len(images)):
+        cv2.warpAffine(images[i], matrices[i], (cols, rows), dst=out[i])
+    return out
+
+#---------------------------------------------------#
+# Process pool workers - the source images are handed
+# over once when the pool starts, each task is only a
+# chunk of source indices & a seed
+#---------------------------------------------------#
+_source_images = None
+
+def _initWorker(images):
+    global _source_images
+    _source_images = images
+
+def _augmentChunk(task):
+    src_idx, seed = task
+    images = _source_images[src_idx]
+    rng = np.random.RandomState(seed)
+    matrices = affineMatrices(len(src_idx), images.shape[1], images.shape[2], rng)
+    return warpImages(images, matrices, np.empty_like(images))
+
+#---------------------------------------------------#
+# Append count augmented images to the dataset.  The
+# output array is allocated once with the originals
+# first, and the new images are generated in chunks
+# across a process pool, cycling over the source
+# images in order like the notebook loop did
+#---------------------------------------------------#
+def augmentDataset(X, y, count, processes=None, seed=None, chunk_size=CHUNK_SIZE):
+    n = len(X)
+    X_out = np.empty((n+count,) + X.shape[1:], dtype=X.dtype)
+    y_out = np.empty((n+count,), dtype=y.dtype)
+    X_out[:n] = X
+    y_out[:n] = y
+    src_idx = np.arange(count) % n
+    y_out[n:] = y[src_idx]
+
+    seeds = np.random.RandomState(seed).randint(0, 2**31-1, size=(count+chunk_size-1)//chunk_size)
+    tasks = [(src_idx[start:start+chunk_size], seeds[i])
+             for i, start in enumerate(range(0, count, chunk_size))]
+    # The copied originals are the workers' source, X may be a view over a memory map
+    pool = Pool(processes, initializer=_initWorker, initargs=(X_out[:n],))
+    try:
+        start = n
+        for chunk in pool.imap(_augmentChunk, tasks):
+            X_out[start:start+len(chunk)] = chunk
+            start += len(chunk)
+    finally:
+        pool.close()
+        pool.join()
+    return X_out, y_out
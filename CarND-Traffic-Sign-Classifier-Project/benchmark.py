@@ -0,0 +1,114 @@
+import argparse
+import csv
+import gc
+import os
+import time
+
+import numpy as np
+
+from checkpoint_model import LeNetCheckpoint
+from normalize import LegacyNormalizer
+from dataset_store import loadStore
+from evaluation import Evaluator
+
+#---------------------------------------------------#
+# Define Benchmark Parameters
+#---------------------------------------------------#
+CHECKPOINTS = ['lenet_german_traffic_sign', 'R1/lenet_german_traffic_sign', 'R2/lenet_german_traffic_sign']
+TESTING_FILE = 'traffic-signs-data/test.p'
+LARGE_BATCH = 256
+WARMUP_RUNS = 5
+TIMED_RUNS = 50
+OUTPUT_FILE_NAME = 'benchmark_results.csv'
+
+COLUMNS = [('checkpoint', '%-32s'), ('normalization', '%13s'), ('size_mb', '%8.2f'), ('load_s', '%7.2f'),
+           ('rss_mb', '%7.1f'), ('b1_ms', '%7.2f'), ('b1_p90_ms', '%9.2f'), ('b256_ms', '%8.2f'),
+           ('images_per_s', '%12.0f'), ('accuracy', '%8.4f'), ('top5_accuracy', '%13.4f')]
+
+#---------------------------------------------------#
+# Resident memory of this process in MB (Linux)
+#---------------------------------------------------#
+def residentMB():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+def checkpointSizeMB(checkpoint):
+    folder, prefix = os.path.split(checkpoint)
+    folder = folder or '.'
+    return sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)
+               if name.startswith(prefix + '.')) / 2**20
+
+#---------------------------------------------------#
+# Median & 90th percentile latency (ms) of predicting
+# the batch, after a few warm up runs
+#---------------------------------------------------#
+def latency(model, batch, warmup=WARMUP_RUNS, runs=TIMED_RUNS):
+    for i in range(warmup):
+        model.predict(batch)
+    times = np.empty(runs)
+    for i in range(runs):
+        start = time.perf_counter()
+        model.predict(batch)
+        times[i] = time.perf_counter() - start
+    return 1000*np.median(times), 1000*np.percentile(times, 90)
+
+#---------------------------------------------------#
+# Restore one checkpoint into its own graph & session
+# and measure it on the given test data.  Checkpoints
+# without saved statistics get the legacy preprocess()
+# with the test set's own statistics (legacy_normalizer
+# fitted on X_test), as the notebook evaluated them
+#---------------------------------------------------#
+def benchmarkCheckpoint(checkpoint, X_test, y_test, legacy_normalizer, large_batch=LARGE_BATCH,
+                        runs=TIMED_RUNS):
+    gc.collect()
+    rss_before = residentMB()
+    start = time.perf_counter()
+    model = LeNetCheckpoint(checkpoint, legacy_normalizer=legacy_normalizer)
+    model.predict(X_test[:1])
+    load_s = time.perf_counter() - start
+    rss_mb = residentMB() - rss_before
+
+    b1_ms, b1_p90_ms = latency(model, X_test[:1], runs=runs)
+    large = X_test[:large_batch]
+    b256_ms, _ = latency(model, large, runs=runs)
+
+    with model.graph.as_default():
+        evaluator = Evaluator(model.logits, model.x, preprocess=model.preprocess)
+    report = evaluator.evaluate(X_test, y_test, sess=model.sess)
+    model.close()
+
+    return {'checkpoint': checkpoint, 'normalization': model.normalization,
+            'size_mb': checkpointSizeMB(checkpoint), 'load_s': load_s, 'rss_mb': rss_mb,
+            'b1_ms': b1_ms, 'b1_p90_ms': b1_p90_ms, 'b256_ms': b256_ms,
+            'images_per_s': 1000*len(large)/b256_ms, 'accuracy': report['accuracy'],
+            'top5_accuracy': report['top_k_accuracy']}
+
+def printTable(results):
+    print(' '.join(('%' + fmt[1:].split('.')[0].rstrip('sdf') + 's') % name for name, fmt in COLUMNS))
+    for result in results:
+        print(' '.join(fmt % result[name] for name, fmt in COLUMNS))
+
+def saveResults(file_name, results):
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=[name for name, fmt in COLUMNS])
+        writer.writeheader()
+        writer.writerows(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the saved LeNet checkpoints')
+    parser.add_argument('checkpoints', type=str, nargs='*', default=CHECKPOINTS, help='Checkpoint prefixes.')
+    parser.add_argument('--test', type=str, default=TESTING_FILE, help='Test set pickle.')
+    parser.add_argument('--runs', type=int, default=TIMED_RUNS, help='Timed runs per latency measure.')
+    parser.add_argument('--output', type=str, default=OUTPUT_FILE_NAME)
+    args = parser.parse_args()
+
+    test = loadStore(args.test)
+    X_test, y_test = test.all_features, test.all_labels
+    legacy_normalizer = LegacyNormalizer().fit(X_test)
+    results = [benchmarkCheckpoint(checkpoint, X_test, y_test, legacy_normalizer, runs=args.runs)
+               for checkpoint in args.checkpoints]
+    printTable(results)
+    saveResults(args.output, results)
+    print('Saved results to', args.output)
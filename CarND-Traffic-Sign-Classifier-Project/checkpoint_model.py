@@ -0,0 +1,75 @@
+import os
+import tensorflow as tf
+
+from normalize import StreamingNormalizer, normFileFor
+
+#---------------------------------------------------#
+# Define Checkpoint Parameters
+#---------------------------------------------------#
+CHECKPOINT_NAME = 'lenet_german_traffic_sign'
+TOP_K = 5
+
+#---------------------------------------------------#
+# Input & logits tensors of a restored LeNet graph.
+# Models saved by the notebook now register them in
+# the 'inputs'/'logits' collections.  The older saved
+# graphs hold one copy of the network per re-run cell,
+# there the last built copy is taken - its input is
+# the last placeholder feeding a Conv2D & its logits
+# are what the last argmax (not of a one hot) reads
+#---------------------------------------------------#
+def modelTensors(graph):
+    inputs, logits = graph.get_collection('inputs'), graph.get_collection('logits')
+    if inputs and logits:
+        return inputs[-1], logits[-1]
+    ops = graph.get_operations()
+    x = [op.inputs[0] for op in ops if op.type == 'Conv2D'
+         and op.inputs[0].op.type in ('Placeholder', 'PlaceholderWithDefault')][-1]
+    logits = [op.inputs[0] for op in ops if op.type == 'ArgMax'
+              and op.inputs[0].op.type != 'OneHot'][-1]
+    return x, logits
+
+#---------------------------------------------------#
+# A saved checkpoint restored into its own graph and
+# session, with softmax top-k on top.  Normalization
+# statistics saved alongside it are applied to every
+# batch.  Older checkpoints were trained on the legacy
+# preprocess() output & need a LegacyNormalizer fitted
+# on reference images; without one the model is not
+# loaded, raw pixels give meaningless results
+#---------------------------------------------------#
+class LeNetCheckpoint():
+    def __init__(self, checkpoint=CHECKPOINT_NAME, k=TOP_K, legacy_normalizer=None):
+        self.checkpoint = checkpoint
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            saver = tf.train.import_meta_graph(checkpoint + '.meta', clear_devices=True)
+            self.x, self.logits = modelTensors(self.graph)
+            self.probs = tf.nn.softmax(self.logits)
+            self.top_k = tf.nn.top_k(self.probs, k)
+        self.sess = tf.Session(graph=self.graph)
+        saver.restore(self.sess, checkpoint)
+
+        if os.path.exists(normFileFor(checkpoint)):
+            self.normalizer = StreamingNormalizer().load(normFileFor(checkpoint))
+            self.normalization = 'saved'
+        elif legacy_normalizer is not None:
+            self.normalizer = legacy_normalizer
+            self.normalization = 'legacy'
+        else:
+            self.sess.close()
+            raise ValueError('%s has no saved normalization statistics (%s), reference images are '
+                             'needed for its legacy preprocessing' % (checkpoint, normFileFor(checkpoint)))
+
+    def preprocess(self, batch):
+        return self.normalizer.apply(batch)
+
+    #---------------------------------------------------#
+    # Top-k (probabilities, class ids) of an image batch
+    #---------------------------------------------------#
+    def predict(self, batch):
+        top_k = self.sess.run(self.top_k, feed_dict={self.x: self.preprocess(batch)})
+        return top_k.values, top_k.indices
+
+    def close(self):
+        self.sess.close()
@@ -0,0 +1,119 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+from checkpoint_model import LeNetCheckpoint, CHECKPOINT_NAME
+from dataset_store import loadStore
+from normalize import LegacyNormalizer
+
+#---------------------------------------------------#
+# Define Batch Inference Parameters
+#---------------------------------------------------#
+IMAGE_SIZE = 32
+BATCH_SIZE = 512
+DECODE_THREADS = 4
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp')
+OUTPUT_FILE_NAME = 'predictions.csv'
+
+def readSignNames(file_name='signnames.csv'):
+    with open(file_name, 'rt') as f:
+        return [row['SignName'] for row in csv.DictReader(f)]
+
+def imageFiles(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+#---------------------------------------------------#
+# Decode an image of any size as 32x32 RGB - the
+# training pickles are RGB, cv2 decodes to BGR
+#---------------------------------------------------#
+def readSignImage(file_name):
+    image = cv2.imread(file_name)
+    if image is None:
+        raise IOError('Can not read image %s' % file_name)
+    image = cv2.resize(image, (IMAGE_SIZE, IMAGE_SIZE), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+#---------------------------------------------------#
+# (image, None) or (None, error message), so one bad
+# file does not stop the whole folder
+#---------------------------------------------------#
+def tryReadSignImage(file_name):
+    try:
+        return readSignImage(file_name), None
+    except (IOError, cv2.error) as e:
+        return None, str(e).strip()
+
+#---------------------------------------------------#
+# Stream uint8 image batches of the files given.  The
+# next batch is decoded in a thread pool while the
+# current one runs through the model.  Yields the
+# names & images of the files read and the (name,
+# error) of the files that could not be read
+#---------------------------------------------------#
+def imageBatches(file_names, batch_size=BATCH_SIZE, threads=DECODE_THREADS):
+    with ThreadPoolExecutor(threads) as pool:
+        chunks = [file_names[i:i+batch_size] for i in range(0, len(file_names), batch_size)]
+        pending = pool.map(tryReadSignImage, chunks[0]) if chunks else None
+        for i, chunk in enumerate(chunks):
+            results = list(pending)
+            if i+1 < len(chunks):
+                pending = pool.map(tryReadSignImage, chunks[i+1])
+            names = [name for name, (image, error) in zip(chunk, results) if error is None]
+            images = np.stack([image for image, error in results if error is None]) if names else None
+            errors = [(name, error) for name, (image, error) in zip(chunk, results) if error is not None]
+            yield names, images, errors
+
+def classifyFolder(model, folder, sign_names, output_file, batch_size=BATCH_SIZE, threads=DECODE_THREADS):
+    file_names = imageFiles(folder)
+    failed = 0
+    with open(output_file, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['File', 'ClassId', 'SignName', 'Probability',
+                         'Top5ClassIds', 'Top5SignNames', 'Top5Probabilities', 'Error'])
+        for names, images, errors in imageBatches(file_names, batch_size, threads):
+            if images is not None:
+                probs, ids = model.predict(images)
+                for name, p, c in zip(names, probs, ids):
+                    writer.writerow([os.path.relpath(name, folder), c[0], sign_names[c[0]], '%.4f' % p[0],
+                                     ' '.join(str(i) for i in c), '|'.join(sign_names[i] for i in c),
+                                     ' '.join('%.4f' % v for v in p), ''])
+            for name, error in errors:
+                print('Skipped', name, '-', error)
+                writer.writerow([os.path.relpath(name, folder), '', '', '', '', '', '', error])
+            failed += len(errors)
+    return len(file_names) - failed, failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batch traffic sign classification of an image folder')
+    parser.add_argument('images', type=str, help='Folder of traffic sign images, any size.')
+    parser.add_argument('--checkpoint', type=str, default=CHECKPOINT_NAME, help='Saved model checkpoint prefix.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--threads', type=int, default=DECODE_THREADS, help='Image decoding threads.')
+    parser.add_argument('--output', type=str, default=OUTPUT_FILE_NAME)
+    parser.add_argument('--reference', type=str, default=None,
+    help='Dataset pickle (e.g. traffic-signs-data/test.p) whose statistics normalize a checkpoint '
+         'saved without them, as the legacy preprocess() did.')
+    args = parser.parse_args()
+
+    legacy_normalizer = None
+    if args.reference:
+        legacy_normalizer = LegacyNormalizer().fit(loadStore(args.reference).all_features)
+    try:
+        model = LeNetCheckpoint(args.checkpoint, legacy_normalizer=legacy_normalizer)
+    except ValueError as e:
+        parser.error('%s. Pass --reference' % e)
+    start = time.perf_counter()
+    count, failed = classifyFolder(model, args.images, readSignNames(), args.output, args.batch_size, args.threads)
+    elapsed = time.perf_counter() - start
+    model.close()
+    print('Classified %d images in %.2fs (%.0f images/s)' % (count, elapsed, count/max(elapsed, 1e-9)))
+    if failed:
+        print('Could not read %d images, see the Error column' % failed)
+    print('Saved predictions to', args.output)
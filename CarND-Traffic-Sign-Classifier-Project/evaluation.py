@@ -0,0 +1,74 @@
+import json
+import numpy as np
+import tensorflow as tf
+
+#---------------------------------------------------#
+# Define Evaluation Parameters
+#---------------------------------------------------#
+EVAL_BATCH_SIZE = 1024
+TOP_K = 5
+
+#---------------------------------------------------#
+# Single pass evaluation.  One top-k op is run per
+# (large) batch, and accuracy, top-k accuracy & the
+# confusion matrix are all accumulated from its
+# indices, so a full dataset costs one inference sweep
+#---------------------------------------------------#
+class Evaluator():
+    def __init__(self, logits, x, n_classes=43, k=TOP_K, batch_size=EVAL_BATCH_SIZE, preprocess=None):
+        self.x = x                          # Input the batches are fed to
+        self.n_classes = n_classes
+        self.k = k
+        self.batch_size = batch_size
+        self.preprocess = preprocess        # Applied to each batch before feeding, e.g. normalization
+        self.top_k_op = tf.nn.top_k(logits, k).indices
+
+    def evaluate(self, X_data, y_data, sess=None):
+        sess = sess or tf.get_default_session()
+        confusion = np.zeros((self.n_classes, self.n_classes), dtype=np.int64)
+        top_k_hits = 0
+        for offset in range(0, len(X_data), self.batch_size):
+            batch_x = X_data[offset:offset+self.batch_size]
+            batch_y = np.asarray(y_data[offset:offset+self.batch_size], dtype=np.int64)
+            if self.preprocess is not None:
+                batch_x = self.preprocess(batch_x)
+            top_k = sess.run(self.top_k_op, feed_dict={self.x: batch_x})
+            confusion += np.bincount(batch_y*self.n_classes + top_k[:, 0],
+                                     minlength=self.n_classes**2).reshape(confusion.shape)
+            top_k_hits += int((top_k == batch_y[:, None]).any(axis=1).sum())
+        return evaluationReport(confusion, top_k_hits, self.k)
+
+#---------------------------------------------------#
+# Accuracy, top-k accuracy & per class precision and
+# recall from the confusion matrix (rows are the true
+# classes, columns the predicted ones)
+#---------------------------------------------------#
+def evaluationReport(confusion, top_k_hits, k):
+    examples = int(confusion.sum())
+    correct = np.diag(confusion)
+    predicted, actual = confusion.sum(axis=0), confusion.sum(axis=1)
+    precision = np.where(predicted > 0, correct / np.maximum(predicted, 1), 0.0)
+    recall = np.where(actual > 0, correct / np.maximum(actual, 1), 0.0)
+    return {'examples': examples,
+            'accuracy': float(correct.sum()) / max(examples, 1),
+            'k': k,
+            'top_k_accuracy': float(top_k_hits) / max(examples, 1),
+            'precision': precision.tolist(),
+            'recall': recall.tolist(),
+            'support': actual.tolist(),
+            'confusion': confusion.tolist()}
+
+def saveReport(file_name, report, sign_names=None):
+    report = dict(report)
+    if sign_names is not None:
+        report['sign_names'] = list(sign_names)
+    with open(file_name, 'w') as f:
+        json.dump(report, f, indent=1)
+
+def printReport(report, sign_names=None):
+    print('Examples = %d, Accuracy = %.3f, Top-%d Accuracy = %.3f'
+          % (report['examples'], report['accuracy'], report['k'], report['top_k_accuracy']))
+    print('Class  Precision  Recall  Support')
+    for c, (p, r, s) in enumerate(zip(report['precision'], report['recall'], report['support'])):
+        name = '  ' + sign_names[c] if sign_names is not None else ''
+        print('%5d  %9.3f  %6.3f  %7d%s' % (c, p, r, s, name))
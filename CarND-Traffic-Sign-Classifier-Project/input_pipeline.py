@@ -0,0 +1,124 @@
+import threading
+import numpy as np
+import tensorflow as tf
+
+from augment import affineMatrices, warpImages
+
+#---------------------------------------------------#
+# Define Input Pipeline Parameters
+#---------------------------------------------------#
+CAPACITY = 8192
+MIN_AFTER_DEQUEUE = 2048
+CHUNK_SIZE = 512
+FEED_THREADS = 2
+
+#---------------------------------------------------#
+# Queue backed input pipeline for the LeNet trainer.
+# Feeder threads walk a shuffled index order per
+# epoch, gather a chunk of images, augment a fraction
+# of them, normalize them in float32 & enqueue them
+# into a RandomShuffleQueue, which is the shuffle
+# buffer & the prefetch between the host and the
+# training step.  The graph dequeues its batches
+# itself, so a training step needs no feed_dict.
+# (tf.data is not there in the TF 0.12 we build on,
+# this is the queue runner equivalent of it)
+#---------------------------------------------------#
+class InputPipeline():
+    def __init__(self, X, y, batch_size, normalizer, augment_fraction=0.0, seed=None,
+                 capacity=CAPACITY, min_after_dequeue=MIN_AFTER_DEQUEUE,
+                 chunk_size=CHUNK_SIZE, threads=FEED_THREADS):
+        self.X, self.y = X, y                       # Training images (uint8) & labels
+        self.batch_size = batch_size
+        self.normalizer = normalizer                # StreamingNormalizer fitted on X
+        self.augment_fraction = augment_fraction    # Share of images warped on the fly
+        self.chunk_size = chunk_size                # Images gathered per enqueue
+        self.threads = threads                      # Feeder threads
+        self.rng = np.random.RandomState(seed)
+        self.lock = threading.Lock()                # Guards the chunk order & rng
+        self.chunk_iter = None
+        self.running = 0                            # Feeder threads still running
+
+        image_shape = tuple(X.shape[1:])
+        self.x_chunk = tf.placeholder(tf.float32, (None,) + image_shape)
+        self.y_chunk = tf.placeholder(tf.int32, (None,))
+        self.queue = tf.RandomShuffleQueue(capacity, min_after_dequeue, [tf.float32, tf.int32],
+                                           shapes=[image_shape, ()], seed=seed)
+        self.enqueue_op = self.queue.enqueue_many([self.x_chunk, self.y_chunk])
+        self.close_op = self.queue.close()
+        self.cancel_op = self.queue.close(cancel_pending_enqueues=True)
+        self.batch_x, self.batch_y = self.queue.dequeue_many(batch_size)
+
+    def stepsPerEpoch(self):
+        return len(self.X) // self.batch_size
+
+    #---------------------------------------------------#
+    # Index chunks of every epoch, in a new order each
+    # epoch - only the index array is shuffled
+    #---------------------------------------------------#
+    def _chunks(self, epochs):
+        for epoch in range(epochs):
+            order = self.rng.permutation(len(self.X))
+            for start in range(0, len(order), self.chunk_size):
+                yield order[start:start+self.chunk_size]
+
+    def _nextChunk(self):
+        with self.lock:
+            return next(self.chunk_iter, None)
+
+    def _makeChunk(self, idx, rng):
+        # sorted gather reads the source sequentially, the queue shuffles anyway
+        idx = np.sort(idx)
+        images, labels = self.X[idx], self.y[idx]
+        if self.augment_fraction > 0:
+            warp = np.nonzero(rng.uniform(size=len(idx)) < self.augment_fraction)[0]
+            if len(warp):
+                src = images[warp]
+                matrices = affineMatrices(len(warp), src.shape[1], src.shape[2], rng)
+                images[warp] = warpImages(src, matrices, np.empty_like(src))
+        return self.normalizer.apply(images), labels
+
+    def _feed(self, sess, coord):
+        with self.lock:
+            rng = np.random.RandomState(self.rng.randint(0, 2**31-1))
+        try:
+            while not coord.should_stop():
+                idx = self._nextChunk()
+                if idx is None:
+                    break
+                images, labels = self._makeChunk(idx, rng)
+                sess.run(self.enqueue_op, feed_dict={self.x_chunk: images, self.y_chunk: labels})
+        except (tf.errors.CancelledError, tf.errors.AbortedError):
+            pass
+        except Exception as e:
+            coord.request_stop(e)
+        finally:
+            with self.lock:
+                self.running -= 1
+                last = self.running == 0
+            # the last feeder closes the queue, so the remaining batches drain
+            if last and not coord.should_stop():
+                self._close(sess, self.close_op)
+
+    def _close(self, sess, close_op):
+        try:
+            sess.run(close_op)
+        except tf.errors.CancelledError:
+            pass    # already closed
+
+    #---------------------------------------------------#
+    # Start the feeder threads for the given epochs
+    #---------------------------------------------------#
+    def start(self, sess, coord, epochs):
+        self.chunk_iter = self._chunks(epochs)
+        self.running = self.threads
+        threads = [threading.Thread(target=self._feed, args=(sess, coord), daemon=True)
+                   for i in range(self.threads)]
+        for t in threads:
+            t.start()
+        return threads
+
+    def stop(self, sess, coord, threads):
+        coord.request_stop()
+        self._close(sess, self.cancel_op)
+        coord.join(threads)
@@ -0,0 +1,113 @@
+import numpy as np
+
+#---------------------------------------------------#
+# Define Normalization Parameters
+#---------------------------------------------------#
+CHUNK_SIZE = 2048
+NORM_FILE_SUFFIX = '_norm.npz'
+
+#---------------------------------------------------#
+# Statistics file saved alongside a model checkpoint,
+# e.g. lenet_german_traffic_sign_norm.npz
+#---------------------------------------------------#
+def normFileFor(model_file):
+    return model_file + NORM_FILE_SUFFIX
+
+#---------------------------------------------------#
+# Per pixel mean & std of the training images in one
+# streaming pass.  Each chunk is converted to float64
+# on its own and merged into the running statistics
+# (Welford / Chan parallel update), so the dataset is
+# never copied to float as a whole.  Batches are then
+# normalized on the fly in float32
+#---------------------------------------------------#
+class StreamingNormalizer():
+    def __init__(self):
+        self.count = 0          # Images seen so far
+        self.mean = None        # Running per pixel mean (float64)
+        self.m2 = None          # Running sum of squared deviations (float64)
+        self.mean32 = None      # float32 mean used by apply
+        self.inv_std32 = None   # float32 1/std used by apply
+
+    def update(self, chunk):
+        chunk = np.asarray(chunk, dtype=np.float64)
+        n_b = len(chunk)
+        if n_b == 0:
+            return
+        mean_b = chunk.mean(axis=0)
+        chunk -= mean_b
+        m2_b = np.einsum('i...,i...->...', chunk, chunk)
+        if self.count == 0:
+            self.count, self.mean, self.m2 = n_b, mean_b, m2_b
+        else:
+            n = self.count + n_b
+            delta = mean_b - self.mean
+            self.mean += delta * (n_b / n)
+            self.m2 += m2_b + delta**2 * (self.count * n_b / n)
+            self.count = n
+        self._finalize()
+
+    def fit(self, X, chunk_size=CHUNK_SIZE):
+        for start in range(0, len(X), chunk_size):
+            self.update(X[start:start+chunk_size])
+        return self
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / self.count)
+
+    def _finalize(self):
+        std = self.std
+        self.mean32 = self.mean.astype(np.float32)
+        self.inv_std32 = (1.0 / np.where(std > 0, std, 1.0)).astype(np.float32)
+
+    #---------------------------------------------------#
+    # (batch - mean) / std as float32, into out if given
+    #---------------------------------------------------#
+    def apply(self, batch, out=None):
+        out = np.subtract(batch, self.mean32, out=out, dtype=np.float32)
+        out *= self.inv_std32
+        return out
+
+    def save(self, file_name):
+        np.savez(file_name, count=self.count, mean=self.mean, m2=self.m2)
+
+    def load(self, file_name):
+        with np.load(file_name) as data:
+            self.count = int(data['count'])
+            self.mean, self.m2 = data['mean'], data['m2']
+        self._finalize()
+        return self
+
+#---------------------------------------------------#
+# preprocess() of the notebook before the statistics
+# were saved with the model, for the checkpoints made
+# then (the root, R1 & R2 ones).  It took the stats of
+# the set it was given: the per pixel mean, cast to
+# uint8 & subtracted in uint8 (so it wraps around),
+# then a division by the per pixel std of the result.
+# Fitted on the same set it reproduces that exactly,
+# e.g. the test set the notebook reported accuracy on
+#---------------------------------------------------#
+class LegacyNormalizer():
+    def __init__(self):
+        self.mean8 = None       # Per pixel mean as uint8, as preprocess() subtracted it
+        self.inv_std32 = None   # float32 1/std of the mean subtracted images
+
+    def fit(self, X, chunk_size=CHUNK_SIZE):
+        total = None
+        for start in range(0, len(X), chunk_size):
+            chunk_sum = np.asarray(X[start:start+chunk_size], dtype=np.float64).sum(axis=0)
+            total = chunk_sum if total is None else total + chunk_sum
+        self.mean8 = (total / len(X)).astype(np.uint8)
+        centered = StreamingNormalizer()
+        for start in range(0, len(X), chunk_size):
+            centered.update(np.asarray(X[start:start+chunk_size], dtype=np.uint8) - self.mean8)
+        std = centered.std
+        self.inv_std32 = (1.0 / np.where(std > 0, std, 1.0)).astype(np.float32)
+        return self
+
+    def apply(self, batch, out=None):
+        centered = np.asarray(batch, dtype=np.uint8) - self.mean8
+        out = np.multiply(centered, self.inv_std32, out=out, dtype=np.float32)
+        return out
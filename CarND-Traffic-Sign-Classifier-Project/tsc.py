@@ -1,18 +1,17 @@
-import pickle
 import csv
+from dataset_store import loadStore
 
 # TODO: Fill this in based on where you saved the training and testing data
 
 training_file = 'traffic-signs-data/train.p'
 testing_file = 'traffic-signs-data/test.p'
 
-with open(training_file, mode='rb') as f:
-    train = pickle.load(f)
-with open(testing_file, mode='rb') as f:
-    test = pickle.load(f)
-    
-X_train, y_train = train['features'], train['labels']
-X_test, y_test = test['features'], test['labels']
+# The pickles are converted once to .npy stores & opened memory mapped
+train = loadStore(training_file)
+test = loadStore(testing_file)
+
+X_train, y_train = train.features, train.labels
+X_test, y_test = test.features, test.labels
 
 # TODO: Number of training examples
 n_train = len(X_train)
@@ -24,7 +23,7 @@ n_test = len(X_test)
 image_shape = X_train[0].shape
 
 # TODO: How many unique classes/labels there are in the dataset.
-n_classes = len(set(y_test))
+n_classes = test.n_classes
 
 print("Number of training examples =", n_train)
 print("Number of testing examples =", n_test)
@@ -62,8 +61,10 @@ class_dict['SignName'] = sign_names
 # plt.imshow(image, cmap="color")
 # plt.show()
 
-from sklearn.model_selection import train_test_split
-X_train, X_validation, y_train, y_validation = train_test_split(X_train, y_train, test_size=0.2, random_state=42)
+# Stratified split - both sets are index views over the memory mapped store
+train_set, validation_set = train.split(0.2, seed=42)
+X_train, y_train = train_set.features, train_set.labels
+X_validation, y_validation = validation_set.features, validation_set.labels
 
 n_train = len(X_train)
 n_validation = len(X_validation)
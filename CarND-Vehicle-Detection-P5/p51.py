@@ -11,7 +11,7 @@ from skimage.feature import hog
 from sklearn.preprocessing import StandardScaler
 from sklearn.svm import LinearSVC
 from sklearn.cross_validation import train_test_split
-from scipy.ndimage.measurements import label
+from scipy.ndimage.measurements import label, find_objects
 from tqdm import tqdm
 
 #-------------------------------------------------------------------#
@@ -27,19 +27,22 @@ hist_bins = 16    # Number of histogram bins
 spatial_feat = True # Spatial features on or off
 hist_feat = True # Histogram features on or off
 hog_feat = True # HOG features on or off
-y_start_stop1 = [350, 650] # Min and max in y to search in slide_window()
-y_start_stop2 = [350, 650] # Min and max in y to search in slide_window()
-y_start_stop3 = [350, 700] # Min and max in y to search in slide_window()
-y_start_stop4 = [350, 700] # Min and max in y to search in slide_window()
 
-xy_window1=(80, 80) # window size to use in slide window function 
-xy_window2=(96, 96) # window size to use in slide window function 
-xy_window3=(128, 128) # window size to use in slide window function 
-xy_window4=(160, 160) # window size to use in slide window function 
+#-------------------------------------------------------------------#
+#Camera & road geometry used to plan the search windows
+#-------------------------------------------------------------------#
+horizon_row = 420 # image row of the vanishing point of the lane lines (straight_lines1.jpg)
+lane_width_bottom = 905 # lane width in pixels at the bottom row of the image (straight_lines1.jpg)
+car_lane_ratio = 0.57 # car width as a fraction of the lane width (0.40-0.78 in the test images)
+window_sizes = (80, 96, 128, 160, 224, 320) # square window sizes to search
+window_scale_tolerance = 1.5 # cars from size/tolerance to size*tolerance wide match a window
+search_lanes = 2.5 # lanes either side of the vanishing point a window centre may be in
+search_bottom = 700 # lowest row searched by the largest window size
 
 xy_overlap=(0.50, 0.50)# window overlap in slide window function
 svc = None
 windows = None
+search_band = None # (y_start, y_stop, x_start, x_stop) covered by the windows
 last_hot_boxes = []
 no_of_last_boxes = 12
 
@@ -233,6 +236,58 @@ def slide_window(img, x_start_stop=[None, None], y_start_stop=[None, None],
     # Return the list of windows
     return window_list
 
+#-------------------------------------------------------------------#
+# Define a function that plans the search bands of each window size
+# from the road geometry.  On a flat road the width of a car, like the
+# lane width, grows linearly with the distance of its bottom edge
+# below the horizon row.  So a window of a given size only needs the
+# rows where a car of about that size can stand, and only the columns
+# where its centre is within search_lanes lane widths of the vanishing
+# point there.  The largest size searches down to search_bottom at
+# least, for the cars closer than any window size was planned for.
+# Each band is laid out upward from its lowest row, as slide_window
+# drops the rows a whole step does not fit in at the bottom.
+# Returns a list of (xy_window, x_start_stop, y_start_stop)
+#-------------------------------------------------------------------#
+def window_plan(image_shape, horizon_row=420, lane_width_bottom=905,
+                    car_lane_ratio=0.57, window_sizes=(80, 96, 128, 160, 224, 320),
+                    window_scale_tolerance=1.5, search_lanes=2.5, search_bottom=700,
+                    xy_overlap=(0.5, 0.5)):
+    rows, cols = image_shape[0], image_shape[1]
+    # Lane & car width in pixels per row below the horizon
+    lane_per_row = lane_width_bottom / (rows - horizon_row)
+    car_per_row = lane_per_row * car_lane_ratio
+    plan = []
+    for size in window_sizes:
+        # Rows of the bottom edge of cars this window size can match
+        bottom_min = horizon_row + size / (car_per_row * window_scale_tolerance)
+        bottom_max = horizon_row + size * window_scale_tolerance / car_per_row
+        if size == max(window_sizes):
+            bottom_max = max(bottom_max, search_bottom)
+        bottom_max = min(bottom_max, rows)
+        if bottom_min >= rows:
+            continue
+        # Whole steps up from the lowest row to cover the highest one
+        y_step = int(size * (1 - xy_overlap[1]))
+        y_stop = int(bottom_max)
+        steps = int(np.ceil(max(y_stop - int(bottom_min), 0) / y_step))
+        y_start_stop = [max(y_stop - size - steps * y_step, 0), y_stop]
+        # The road is widest at the lowest row of the band
+        half_width = search_lanes * lane_per_row * (bottom_max - horizon_row) + size/2
+        x_start_stop = [max(int(cols/2 - half_width), 0), min(int(cols/2 + half_width), cols)]
+        plan.append(((size, size), x_start_stop, y_start_stop))
+    return plan
+
+#-------------------------------------------------------------------#
+# Define a function that gives the windows of all the planned bands
+#-------------------------------------------------------------------#
+def plan_windows(img, plan, xy_overlap=(0.5, 0.5)):
+    window_list = []
+    for xy_window, x_start_stop, y_start_stop in plan:
+        window_list += slide_window(img, x_start_stop=list(x_start_stop), y_start_stop=list(y_start_stop),
+                            xy_window=xy_window, xy_overlap=xy_overlap)
+    return window_list
+
 #-------------------------------------------------------------------#
 # Define a function to draw bounding boxes
 #-------------------------------------------------------------------#
@@ -511,47 +566,62 @@ def apply_threshold(heatmap, threshold):
     return heatmap
 
 #-------------------------------------------------------------------#
-# Function that draws rectangles on the images with the given labels
-#-------------------------------------------------------------------#
-def draw_labeled_bboxes(img, labels):
-    # Iterate through all detected cars
-    for car_number in range(1, labels[1]+1):
-        # Find pixels with each car_number label value
-        nonzero = (labels[0] == car_number).nonzero()
-        # Identify x and y values of those pixels
-        nonzeroy = np.array(nonzero[0])
-        nonzerox = np.array(nonzero[1])
-        # Define a bounding box based on min/max x and y
-        bbox = ((np.min(nonzerox), np.min(nonzeroy)), (np.max(nonzerox), np.max(nonzeroy)))
-        # Draw the box on the image
-        cv2.rectangle(img, bbox[0], bbox[1], (0,0,255), 6)
+# Detected car boxes, one row per car: inclusive corner pixels, the
+# heat pixel count & the peak heat of the car
+#-------------------------------------------------------------------#
+box_dtype = np.dtype([('x1', np.int32), ('y1', np.int32), ('x2', np.int32), ('y2', np.int32),
+                      ('area', np.int32), ('peak', np.float32)])
+
+#-------------------------------------------------------------------#
+# Function that extracts the car boxes from the thresholded heatmap.
+# Connected components are labeled in the search band only, as there
+# is no heat outside it, and each car's box, area & peak heat come
+# from its object slice, so no pass is made over the frame per car
+#-------------------------------------------------------------------#
+def extract_boxes(heatmap, band=None):
+    if band is None:
+        band = (0, heatmap.shape[0], 0, heatmap.shape[1])
+    y_start, y_stop, x_start, x_stop = band
+    heat = heatmap[y_start:y_stop, x_start:x_stop]
+    labels, n_cars = label(heat)
+    boxes = np.zeros(n_cars, dtype=box_dtype)
+    for car_number, (ys, xs) in enumerate(find_objects(labels), 1):
+        car = labels[ys, xs] == car_number
+        boxes[car_number-1] = (xs.start + x_start, ys.start + y_start,
+                               xs.stop - 1 + x_start, ys.stop - 1 + y_start,
+                               np.count_nonzero(car), heat[ys, xs][car].max())
+    return boxes
+
+#-------------------------------------------------------------------#
+# Function that draws rectangles on the images for the given boxes
+#-------------------------------------------------------------------#
+def draw_labeled_bboxes(img, boxes):
+    for box in boxes:
+        cv2.rectangle(img, (int(box['x1']), int(box['y1'])), (int(box['x2']), int(box['y2'])), (0,0,255), 6)
     # Return the image
     return img
 
 #-------------------------------------------------------------------#
-# Function that processes a given image
+# Function that finds the car boxes in a given image
 #-------------------------------------------------------------------#
-def process_image(image):
-    draw_image = np.copy(image)
+def detect_cars(image):
     # Uncomment the following line if you extracted training
     # data from .png images (scaled 0 to 1 by mpimg) and the
     # image you are searching is a .jpg (scaled 0 to 255)
     image = image.astype(np.float32)/255
-    global windows
+    global windows, search_band
     if windows is None:
         print('inside windows loop')
-        windows = slide_window(image, x_start_stop=[None, None], y_start_stop=y_start_stop1, 
-                            xy_window=xy_window1, xy_overlap=xy_overlap)
-        #temp_img1 = draw_boxes(np.copy(draw_image), windows, color=(255, 0, 0), thick=4)
-        #print('I-windows to search', len(windows))
-        windows += slide_window(image, x_start_stop=[None, None], y_start_stop=y_start_stop2, 
-                            xy_window=xy_window2, xy_overlap=xy_overlap)
-        #temp_img2 = draw_boxes(np.copy(draw_image), windows, color=(0, 255, 0), thick=4)
-        #print('II-windows to search', len(windows))
-        windows += slide_window(image, x_start_stop=[None, None], y_start_stop=y_start_stop3, 
-                            xy_window=xy_window3, xy_overlap=xy_overlap)
-        #temp_img3 = draw_boxes(np.copy(draw_image), windows, color=(0, 0, 255), thick=4)
-        #print('total windows to search', len(windows))
+        plan = window_plan(image.shape, horizon_row=horizon_row, lane_width_bottom=lane_width_bottom,
+                            car_lane_ratio=car_lane_ratio, window_sizes=window_sizes,
+                            window_scale_tolerance=window_scale_tolerance, search_lanes=search_lanes,
+                            search_bottom=search_bottom, xy_overlap=xy_overlap)
+        for xy_window, x_start_stop, y_start_stop in plan:
+            print('window', xy_window, 'rows', y_start_stop, 'cols', x_start_stop)
+        windows = plan_windows(image, plan, xy_overlap=xy_overlap)
+        search_band = (min(w[0][1] for w in windows), max(w[1][1] for w in windows),
+                       min(w[0][0] for w in windows), max(w[1][0] for w in windows))
+        #temp_img = draw_boxes(np.copy(draw_image), windows, color=(0, 0, 255), thick=4)
     
     print('windows size', len(windows))
     hot_windows = search_windows(image, windows, clf, X_scaler, color_space=color_space, 
@@ -570,12 +640,18 @@ def process_image(image):
     heat = add_heat(heat, hot_windows)
     heat = apply_threshold(heat,2)
     heatmap = np.clip(heat, 0, 255)
-    labels = label(heatmap)
-    final_img = draw_labeled_bboxes(np.copy(draw_image), labels)
-#    visualize3Images(draw_image, window_img, final_img, 
+    return extract_boxes(heatmap, search_band)
+
+#-------------------------------------------------------------------#
+# Function that processes a given image, returns the frame with the
+# car boxes drawn (as VideoFileClip.fl_image needs)
+#-------------------------------------------------------------------#
+def process_image(image):
+    boxes = detect_cars(image)
+    final_img = draw_labeled_bboxes(np.copy(image), boxes)
+#    visualize3Images(image, window_img, final_img, 
 #                     'Original', 'Raw Detection', 'Average Box', 
 #                     None, None, None, True)
-    return labels, final_img
     return final_img
 
 #-------------------------------------------------------------------#
@@ -586,7 +662,9 @@ def process_images(fn_pattern):
     for imgf in imgs:
         print('img file', imgf)
         image = mpimg.imread(imgf)
-        labels, final_img = process_image(image)
+        boxes = detect_cars(image)
+        for box in boxes:
+            print('car', (box['x1'], box['y1']), (box['x2'], box['y2']), 'area', box['area'], 'peak', box['peak'])
 
 #-------------------------------------------------------------------#
 # Function to process video
@@ -0,0 +1,320 @@
+import argparse
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import cv2
+
+#---------------------------------------------------#
+# Define Pipeline Parameters (as in P1.ipynb)
+#---------------------------------------------------#
+GAUSSIAN_KERNEL_SIZE = 5
+CANNY_LOW_THRESHOLD = 50
+CANNY_HIGH_THRESHOLD = 150
+HOUGH_RHO = 1
+HOUGH_THETA = np.pi/180
+HOUGH_THRESHOLD = 15
+HOUGH_MIN_LINE_LEN = 120
+HOUGH_MAX_LINE_GAP = 80
+LINE_COLOR = (0, 0, 255)            # red, frames are BGR here
+LINE_THICKNESS = 5
+
+#---------------------------------------------------#
+# Define Lane Model Parameters
+#---------------------------------------------------#
+EMA_ALPHA = 0.2                     # Weight of the new frame's fit
+BAND_MARGIN = 40                    # Search band, pixels either side of the last line
+MAX_MISSED = 10                     # Frames without a fit before a side is dropped
+MIN_ABS_SLOPE = 0.3                 # Flatter segments (|dy/dx|) are not lane lines
+CROP_PAD = 2                        # Rows above the ROI kept for the edge filters
+
+#---------------------------------------------------#
+# Define Streaming Parameters
+#---------------------------------------------------#
+WORKERS = 4
+READ_AHEAD = 8
+
+#---------------------------------------------------#
+# ROI polygon of process_image for a frame size, and
+# its left/right halves
+#---------------------------------------------------#
+def roiTop(rows):
+    return int(rows*0.625)
+
+def roiVertices(rows, cols):
+    return np.array([[(cols*0.1, rows), (cols*0.4, rows*0.625),
+                      (cols*0.6, rows*0.625), (cols*0.9, rows)]], dtype=np.int32)
+
+def roiHalfVertices(rows, cols, side):
+    if side == 'left':
+        return np.array([[(cols*0.1, rows), (cols*0.4, rows*0.625),
+                          (cols*0.5, rows*0.625), (cols*0.5, rows)]], dtype=np.int32)
+    return np.array([[(cols*0.5, rows), (cols*0.5, rows*0.625),
+                      (cols*0.6, rows*0.625), (cols*0.9, rows)]], dtype=np.int32)
+
+def get_x2(slope, x1, y1, y2):
+    return int(((y2-y1)/slope)+x1)
+
+#---------------------------------------------------#
+# draw_lines of P1.ipynb - average the slopes of the
+# left (negative) & right (positive) segments and
+# extrapolate them down to the bottom of the image
+#---------------------------------------------------#
+def draw_lines(img, lines, color=LINE_COLOR, thickness=LINE_THICKNESS):
+    if lines is None:
+        return
+    segments = lines.reshape(-1, 4).astype(np.float64)
+    x1, y1, x2, y2 = segments.T
+    dx = x2 - x1
+    slopes = np.where(dx != 0, (y2-y1) / np.where(dx != 0, dx, 1), 0.0)
+    left, right = slopes < 0, slopes > 0
+    if not (left.any() and right.any()):
+        return
+    y_end = img.shape[0]
+    ras, las = slopes[right].mean(), slopes[left].mean()
+    rminx = int(np.concatenate([x1[right], x2[right]]).min())
+    rminy = int(np.concatenate([y1[right], y2[right]]).min())
+    lmaxx = int(np.concatenate([x1[left], x2[left]]).max())
+    lminy = int(np.concatenate([y1[left], y2[left]]).min())
+    cv2.line(img, (lmaxx, lminy), (get_x2(las, lmaxx, lminy, y_end), y_end), color, thickness)
+    cv2.line(img, (rminx, rminy), (get_x2(ras, rminx, rminy, y_end), y_end), color, thickness)
+
+#---------------------------------------------------#
+# Fit x = m*y + c to the left (negative slope) & right
+# (positive slope) segments, endpoints weighted by the
+# segment length.  None for a side without segments
+#---------------------------------------------------#
+def fitLaneLines(lines):
+    fits = {'left': None, 'right': None}
+    if lines is None:
+        return fits
+    segments = lines.reshape(-1, 4).astype(np.float64)
+    x1, y1, x2, y2 = segments.T
+    dx, dy = x2 - x1, y2 - y1
+    slopes = dy / np.where(dx != 0, dx, 1e-6)
+    length = np.hypot(dx, dy)
+    steep = np.abs(slopes) >= MIN_ABS_SLOPE
+    for side, selected in (('left', steep & (slopes < 0)), ('right', steep & (slopes > 0))):
+        if selected.any():
+            ys = np.concatenate([y1[selected], y2[selected]])
+            xs = np.concatenate([x1[selected], x2[selected]])
+            w = np.tile(length[selected], 2)
+            fits[side] = tuple(np.polyfit(ys, xs, 1, w=w))
+    return fits
+
+def drawLaneLines(img, lanes, y_top, y_bottom, color=LINE_COLOR, thickness=LINE_THICKNESS):
+    for m, c in (lane for lane in lanes.values() if lane is not None):
+        cv2.line(img, (int(m*y_top + c), y_top), (int(m*y_bottom + c), y_bottom), color, thickness)
+
+#---------------------------------------------------#
+# Lane state across frames - an exponential moving
+# average of each side's (m, c).  A side missing in a
+# frame keeps its last line, and is only dropped after
+# MAX_MISSED frames in a row.  Updated in frame order
+#---------------------------------------------------#
+class LaneModel():
+    def __init__(self, alpha=EMA_ALPHA, max_missed=MAX_MISSED):
+        self.alpha = alpha
+        self.max_missed = max_missed
+        self.lanes = {'left': None, 'right': None}  # Smoothed (m, c) of x = m*y + c
+        self.missed = {'left': 0, 'right': 0}       # Frames in a row without a fit
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.lanes)
+
+    def update(self, lines):
+        fits = fitLaneLines(lines)
+        with self.lock:
+            for side, fit in fits.items():
+                if fit is not None:
+                    last = self.lanes[side]
+                    self.lanes[side] = fit if last is None else \
+                        tuple(self.alpha*np.array(fit) + (1-self.alpha)*np.array(last))
+                    self.missed[side] = 0
+                else:
+                    self.missed[side] += 1
+                    if self.missed[side] > self.max_missed:
+                        self.lanes[side] = None
+            return dict(self.lanes)
+
+#---------------------------------------------------#
+# The P1 frame pipeline with its fixed parts made once.
+# The ROI mask is built once per frame size, and each
+# worker thread keeps its own gray/blur/edges/mask/line
+# buffers, so a frame allocates nothing new.  Only the
+# rows of the ROI go through the filters, and given the
+# last lane lines the Hough transform only sees edges
+# in a band around each of them.  The lane lines are
+# blended into the frame in place
+#---------------------------------------------------#
+class LaneFrameProcessor():
+    def __init__(self):
+        self.masks = {}                     # (rows, cols) -> ROI mask
+        self.lock = threading.Lock()
+        self.local = threading.local()      # Per thread frame buffers
+
+    def roiMask(self, rows, cols):
+        with self.lock:
+            if (rows, cols) not in self.masks:
+                mask = np.zeros((rows, cols), dtype=np.uint8)
+                cv2.fillPoly(mask, roiVertices(rows, cols), 255)
+                self.masks[(rows, cols)] = mask
+            return self.masks[(rows, cols)]
+
+    def buffers(self, rows, cols):
+        local = self.local
+        if getattr(local, 'shape', None) != (rows, cols):
+            local.shape = (rows, cols)
+            local.y0 = max(roiTop(rows) - CROP_PAD, 0)
+            crop = (rows - local.y0, cols)
+            local.gray = np.empty(crop, dtype=np.uint8)
+            local.blur = np.empty(crop, dtype=np.uint8)
+            local.edges = np.empty(crop, dtype=np.uint8)
+            local.masked = np.empty(crop, dtype=np.uint8)
+            local.band = np.empty((rows, cols), dtype=np.uint8)
+            local.line_img = np.empty((rows, cols, 3), dtype=np.uint8)
+        return local
+
+    #---------------------------------------------------#
+    # ROI mask narrowed to a band around each known lane
+    # line, the half of the ROI for a side not known
+    #---------------------------------------------------#
+    def bandMask(self, buf, rows, cols, lanes):
+        band = buf.band
+        band.fill(0)
+        top = roiTop(rows)
+        for side, lane in lanes.items():
+            if lane is None:
+                cv2.fillPoly(band, roiHalfVertices(rows, cols, side), 255)
+            else:
+                m, c = lane
+                x_top, x_bottom = m*top + c, m*rows + c
+                cv2.fillPoly(band, np.array([[(x_top-BAND_MARGIN, top), (x_top+BAND_MARGIN, top),
+                                              (x_bottom+BAND_MARGIN, rows), (x_bottom-BAND_MARGIN, rows)]],
+                                            dtype=np.int32), 255)
+        cv2.bitwise_and(band, self.roiMask(rows, cols), dst=band)
+        return band
+
+    #---------------------------------------------------#
+    # Hough segments of the lane edges in the ROI, or in
+    # the bands around the lanes given
+    #---------------------------------------------------#
+    def detect(self, frame, lanes=None):
+        rows, cols = frame.shape[:2]
+        buf = self.buffers(rows, cols)
+        y0 = buf.y0
+        mask = self.roiMask(rows, cols) if lanes is None else self.bandMask(buf, rows, cols, lanes)
+        cv2.cvtColor(frame[y0:], cv2.COLOR_BGR2GRAY, dst=buf.gray)
+        cv2.GaussianBlur(buf.gray, (GAUSSIAN_KERNEL_SIZE, GAUSSIAN_KERNEL_SIZE), 0, dst=buf.blur)
+        cv2.Canny(buf.blur, CANNY_LOW_THRESHOLD, CANNY_HIGH_THRESHOLD, edges=buf.edges)
+        cv2.bitwise_and(buf.edges, mask[y0:], dst=buf.masked)
+        lines = cv2.HoughLinesP(buf.masked, HOUGH_RHO, HOUGH_THETA, HOUGH_THRESHOLD, np.array([]),
+                                minLineLength=HOUGH_MIN_LINE_LEN, maxLineGap=HOUGH_MAX_LINE_GAP)
+        if lines is not None:
+            lines[..., 1::2] += y0
+        return lines
+
+    #---------------------------------------------------#
+    # weighted_img of P1.ipynb: frame*0.8 + lines, into
+    # the frame itself.  With lanes the smoothed lane
+    # lines are drawn instead of draw_lines' estimate
+    #---------------------------------------------------#
+    def render(self, frame, lines, lanes=None):
+        rows = frame.shape[0]
+        buf = self.buffers(rows, frame.shape[1])
+        buf.line_img.fill(0)
+        if lanes is None:
+            draw_lines(buf.line_img, lines)
+        else:
+            drawLaneLines(buf.line_img, lanes, roiTop(rows), rows)
+        cv2.addWeighted(frame, 0.8, buf.line_img, 1., 0., dst=frame)
+        return frame
+
+    def process(self, frame):
+        return self.render(frame, self.detect(frame))
+
+#---------------------------------------------------#
+# Read frames on a thread into a fixed ring of frame
+# buffers, handed back through free once written
+#---------------------------------------------------#
+def readFrames(capture, frames, free):
+    while True:
+        buf = free.get()
+        ok, frame = capture.read(buf)
+        if not ok:
+            frames.put(None)
+            return
+        frames.put(frame)
+
+#---------------------------------------------------#
+# Decode on a reader thread, process the frames in a
+# worker pool & encode them in order.  At most
+# workers*2 frames are in flight at any time.  With a
+# lane model the workers detect around the latest
+# smoothed lanes, and the model is updated & the lanes
+# drawn in frame order as the frames complete
+#---------------------------------------------------#
+def processVideo(input_file, output_file, processor=None, lane_model=None, workers=WORKERS, read_ahead=READ_AHEAD):
+    processor = processor or LaneFrameProcessor()
+    capture = cv2.VideoCapture(input_file)
+    if not capture.isOpened():
+        raise IOError('Can not open video %s' % input_file)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    cols = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    rows = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    writer = cv2.VideoWriter(output_file, cv2.VideoWriter_fourcc(*'mp4v'), fps, (cols, rows))
+
+    in_flight = workers*2
+    free, frames = queue.Queue(), queue.Queue(read_ahead)
+    for i in range(in_flight + read_ahead + 2):
+        free.put(np.empty((rows, cols, 3), dtype=np.uint8))
+    reader = threading.Thread(target=readFrames, args=(capture, frames, free), daemon=True)
+    reader.start()
+
+    count = 0
+    pending = collections.deque()
+    with ThreadPoolExecutor(workers) as pool:
+        while True:
+            frame = frames.get()
+            if frame is not None:
+                if lane_model is None:
+                    pending.append((frame, pool.submit(processor.process, frame)))
+                else:
+                    pending.append((frame, pool.submit(processor.detect, frame, lane_model.snapshot())))
+            while pending and (len(pending) >= in_flight or frame is None):
+                done, result = pending.popleft()
+                if lane_model is not None:
+                    lines = result.result()
+                    processor.render(done, lines, lane_model.update(lines))
+                else:
+                    result.result()
+                writer.write(done)
+                free.put(done)
+                count += 1
+            if frame is None:
+                break
+    reader.join()
+    capture.release()
+    writer.release()
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Draw the P1 lane lines on a video')
+    parser.add_argument('input', type=str, help='Input video, e.g. solidWhiteRight.mp4')
+    parser.add_argument('output', type=str, help='Output video, e.g. white.mp4')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Frame processing threads.')
+    parser.add_argument('--no-smoothing', action='store_true',
+    help='Per frame lines as in P1.ipynb, no lane model across frames.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    lane_model = None if args.no_smoothing else LaneModel()
+    count = processVideo(args.input, args.output, lane_model=lane_model, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    print('Processed %d frames in %.2fs (%.0f frames/s)' % (count, elapsed, count/max(elapsed, 1e-9)))